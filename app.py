@@ -1,19 +1,52 @@
+import logging
+
 import streamlit as st
 
+from data_loader import dataset_version
+from warmup import page_ready, start_warmup
+
 st.set_page_config(page_title="Ардын Эрх Онооны Тайлан", layout="wide")
 
+# Streamlit only configures its own logger; this shows the app modules'
+# messages (warm-up timings, chart payload sizes, data warnings). Only the
+# first run in the process installs the handler.
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+warmup = start_warmup(dataset_version())
+
+
+def page(path, title):
+    # Pages whose caches are still being filled are marked, not blocked:
+    # opening one just waits on the computation already in progress.
+    return st.Page(path, title=title, icon=None if page_ready(warmup, path) else "⏳")
+
+
 pages = {
     "Эхлэл": [
-        st.Page("home.py", title="ДАТАСЕТ ТОВЧ ТАЙЛАН"),
+        page("home.py", "ДАТАСЕТ ТОВЧ ТАЙЛАН"),
     ],
     "2025 он": [
-        st.Page("page1.py", title="ХЭРЭГЛЭГЧДИЙН ОНООНЫ ТАРХАЦ"),
-        st.Page("page2.py", title="УРАМШУУЛАЛЫН ТӨРӨЛ"),
-        st.Page("page3.py", title="ОНЦЛОХ САР"),
-        st.Page("page4.py", title="ХЭРЭГЛЭГЧДИЙН СЕГМЭНТЧЛЭЛ"),
-        st.Page("page5.py", title="НЭМЭЛТ"),
+        page("page1.py", "ХЭРЭГЛЭГЧДИЙН ОНООНЫ ТАРХАЦ"),
+        page("page2.py", "УРАМШУУЛАЛЫН ТӨРӨЛ"),
+        page("page3.py", "ОНЦЛОХ САР"),
+        page("page4.py", "ХЭРЭГЛЭГЧДИЙН СЕГМЭНТЧЛЭЛ"),
+        page("page5.py", "НЭМЭЛТ"),
     ],
 }
 
+
+@st.fragment(run_every=2)
+def warmup_progress():
+    if warmup['running']:
+        st.progress((len(warmup['done']) + len(warmup['failed'])) / warmup['total'], text="Кэш бэлтгэж байна…")
+    else:
+        # Redraw the navigation once so the page markers clear.
+        st.rerun(scope="app")
+
+
+if warmup['running']:
+    with st.sidebar:
+        warmup_progress()
+
 pg = st.navigation(pages)
-pg.run()
\ No newline at end of file
+pg.run()
@@ -0,0 +1,327 @@
+# Figure builders shared by the pages. Importing this module has no side
+# effects: no data is loaded and plotly is only imported when a figure is
+# built.
+import base64
+import functools
+import json
+import logging
+import re
+
+import numpy as np
+import streamlit as st
+
+from data_loader import latest_version_only
+
+# Integer typed arrays plotly.js decodes, narrowest first.
+INT_DTYPES = ['i1', 'u1', 'i2', 'u2', 'i4', 'u4']
+# Largest float32 rounding error a data array may take: half the 0.01 the
+# pages round their finest values (averages, percentages) to.
+FLOAT_TOLERANCE = 0.005
+
+logger = logging.getLogger(__name__)
+
+
+def bar_plot_h(df, x, y, selected_month, labels=None):
+    import plotly.express as px
+
+    fig = px.bar(
+        df,
+        x=x,
+        y=y,
+        orientation='h',
+        labels=labels or {x: 'Value', y: 'Category'},
+        color=x,
+        text='Percentage',
+        color_continuous_scale='Blues',
+        template='plotly_white',
+    )
+
+    fig.update_traces(
+        textposition='outside',
+        cliponaxis=False,
+        textfont_size=16,
+    )
+
+    # Combine layout updates into one block
+    fig.update_layout(
+        height=500,
+        coloraxis_showscale=False,
+        margin=dict(r=100), # Increased margin for larger % labels
+        title=dict(
+            text=f'<b>{selected_month}-р сарын хэрэглэгчдийн онооны хуваарилалт </b>',
+            font=dict(size=24)
+        ),
+        xaxis=dict(
+            title_text="<b>Нийт хэрэглэгчдийн тоо </b>",
+            title_font=dict(size=18),
+            tickfont=dict(size=14)
+        ),
+        yaxis=dict(
+            title_text="<b>Онооны хэсгүүд</b>",
+            title_font=dict(size=18),
+            tickfont=dict(size=14)
+        )
+    )
+
+    return fig
+
+
+def donut_plot(df, labels_col, values_col, title_text=""):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(data=[go.Pie(
+        labels=df[labels_col],
+        values=df[values_col],
+        hole=.6,
+        marker=dict(line=dict(color='#FFFFFF', width=2)), # White borders between slices
+        hoverinfo='label+percent+value',
+        textinfo='percent',
+        textfont_size=16,
+    )])
+
+    fig.update_layout(
+        title=dict(
+            text=f"<b>{title_text}</b>",
+            font=dict(size=24)
+        ),
+        height=500,
+        width=800,
+        template='plotly_white',
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.2,
+            xanchor="center",
+            x=0.5,
+            font=dict(size=14)
+        ),
+        #"Donut Hole" text
+        annotations=[dict(text='Total', x=0.5, y=0.5, font_size=20, showarrow=False)]
+    )
+
+    return fig
+
+
+def binned_histogram(hist, **kwargs):
+    # Draws counts that are already binned (Bin_Start, Bin_End, count, as
+    # from metrics.get_points_histogram) as bars at the bin centers, so the
+    # browser gets one number per bin instead of the raw values. kwargs go
+    # to px.bar (animation_frame, log_y, labels, ...).
+    import plotly.express as px
+
+    # Empty bins draw nothing, so they are not sent either.
+    hist = hist[hist['count'] > 0]
+    hist = hist.assign(Bin_Center=(hist['Bin_Start'] + hist['Bin_End']) / 2)
+    fig = px.bar(hist, x='Bin_Center', y='count', custom_data=['Bin_Start', 'Bin_End'], **kwargs)
+
+    # Each bar spans its own bin; left to plotly, the width would come from
+    # the smallest gap between the bins that are left.
+    hovertemplate = '%{customdata[0]:,.0f} - %{customdata[1]:,.0f}<br>%{y:,}<extra></extra>'
+    for trace in fig.data + tuple(trace for frame in fig.frames for trace in frame.data):
+        bins = np.asarray(trace.customdata, dtype=float).reshape(-1, 2)
+        trace.width = bins[:, 1] - bins[:, 0]
+        trace.hovertemplate = hovertemplate
+    return fig
+
+
+def box_from_stats(stats, name, **kwargs):
+    # A box trace from precomputed stats (metrics.box_stats): the browser
+    # gets five numbers and the outlier sample instead of the raw column.
+    import plotly.graph_objects as go
+
+    return go.Box(
+        x=[name],
+        q1=[stats['q1']],
+        median=[stats['median']],
+        q3=[stats['q3']],
+        lowerfence=[stats['lowerfence']],
+        upperfence=[stats['upperfence']],
+        y=[stats['outliers']],
+        name=name,
+        boxpoints='all',
+        **kwargs,
+    )
+
+
+def trajectory_plot(df, x, y, size, group, order, name=None, hover_name=None, hover_data=(), size_max=30):
+    # One lines+markers trace per group, its points in `order`. Each point
+    # after the first is an arrow pointing away from the previous point,
+    # and marker opacity ramps from 0.05 to 0.85 along the path, so the
+    # direction reads without an annotation per step. Marker area follows
+    # `size` as in px.scatter(size=..., size_max=...).
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    df = df.sort_values([group, order], kind='stable')
+    step = df.groupby(group, observed=True, sort=False).cumcount().to_numpy()
+    steps = df.groupby(group, observed=True, sort=False)[order].transform('size').to_numpy() - 1
+    opacity = 0.05 + 0.8 * step / np.maximum(steps, 1)
+    symbol = np.where(step == 0, 'circle', 'arrow')
+
+    sizes = df[size].to_numpy(dtype=float)
+    sizeref = 2.0 * np.nanmax(sizes) / size_max ** 2 if len(sizes) else 1
+    hover_data = list(hover_data)
+    hovertemplate = (
+        (f'<b>%{{hovertext}}</b><br>' if hover_name else '')
+        + f'{x}=%{{x}}<br>{y}=%{{y}}<br>{size}=%{{marker.size}}'
+        + ''.join(f'<br>{column}=%{{customdata[{i}]}}' for i, column in enumerate(hover_data))
+        + '<extra>%{fullData.name}</extra>'
+    )
+
+    # Group boundaries in the sorted frame; each trace is a slice of the
+    # arrays computed above.
+    starts = np.flatnonzero(step == 0)
+    ends = np.append(starts[1:], len(df))
+    colors = px.colors.qualitative.Plotly
+    names = df[name if name else group].to_numpy()
+
+    fig = go.Figure()
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        part = df.iloc[start:end]
+        color = colors[i % len(colors)]
+        fig.add_trace(go.Scatter(
+            x=part[x].to_numpy(),
+            y=part[y].to_numpy(),
+            mode='lines+markers',
+            name=str(names[start]),
+            line=dict(color=color, width=2),
+            marker=dict(
+                color=color,
+                size=sizes[start:end],
+                sizemode='area',
+                sizeref=sizeref,
+                sizemin=4,
+                symbol=symbol[start:end],
+                angleref='previous',
+                opacity=opacity[start:end],
+                line=dict(width=1, color='white'),
+            ),
+            hovertext=part[hover_name].to_numpy() if hover_name else None,
+            customdata=part[hover_data].to_numpy() if hover_data else None,
+            hovertemplate=hovertemplate,
+        ))
+
+    fig.update_layout(xaxis_title=x, yaxis_title=y, legend_title_text=name or group)
+    return fig
+
+
+def cached_figure(func):
+    # For builders that return a fully styled figure. The figure is cached
+    # as its plotly JSON, keyed like shared_resource on the builder's
+    # arguments (the dataset version and any widget values; _-prefixed
+    # arguments are not hashed), and every call gets its own Figure rebuilt
+    # from that JSON without re-validation. A page styling its copy further
+    # never reaches the cache. Only the current version's figures are kept.
+    @functools.wraps(func)
+    def to_json(*args, **kwargs):
+        import plotly.io as pio
+
+        return pio.to_json(func(*args, **kwargs), validate=False)
+
+    build = latest_version_only(st.cache_resource(show_spinner=False)(to_json), to_json)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        import plotly.graph_objects as go
+
+        return go.Figure(json.loads(build(*args, **kwargs)), _validate=False)
+
+    wrapper.clear = build.clear
+    return wrapper
+
+
+def _decode(array):
+    values = np.frombuffer(base64.b64decode(array['bdata']), dtype='<' + array['dtype'])
+    if 'shape' in array:
+        values = values.reshape([int(n) for n in array['shape'].split(',')])
+    return values
+
+
+def _encode(values, dtype):
+    array = {'dtype': dtype, 'bdata': base64.b64encode(values.astype('<' + dtype).tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        array['shape'] = ', '.join(str(n) for n in values.shape)
+    return array
+
+
+def compact_array(array):
+    # Whole numbers go to the narrowest integer type that holds them (sums
+    # of points arrive as float64); other floats to float32 only when that
+    # moves no value by more than FLOAT_TOLERANCE, so large fractional
+    # totals keep float64.
+    values = _decode(array)
+    if values.dtype.kind not in 'iuf' or not values.size:
+        return array
+    if values.dtype.kind == 'f' and not (np.isfinite(values).all() and (values == np.round(values)).all()):
+        if values.dtype.itemsize > 4 and np.allclose(values.astype('f4'), values, rtol=0, atol=FLOAT_TOLERANCE, equal_nan=True):
+            return _encode(values, 'f4')
+        return array
+    low, high = values.min(), values.max()
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return _encode(values, dtype)
+    return array
+
+
+def _compact_arrays(obj):
+    # Only arrays plotly itself serialized as typed arrays are touched, so
+    # every one of them is a data array.
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            if 'bdata' in value and 'dtype' in value:
+                obj[key] = compact_array(value)
+            else:
+                _compact_arrays(value)
+
+
+def compact_figure(spec):
+    # Works on the figure's JSON dict in place. A frame only has to carry
+    # what changes: a trace property that is the same in every frame (the
+    # category and hover arrays px repeats per animation_frame) is left to
+    # the base trace, which frames are merged into.
+    for trace in spec.get('data', []):
+        _compact_arrays(trace)
+    for frame in spec.get('frames', []):
+        for trace in frame.get('data', []):
+            _compact_arrays(trace)
+
+    frames = spec.get('frames', [])
+    if frames and all('traces' not in frame for frame in frames):
+        for i, trace in enumerate(spec.get('data', [])):
+            frame_traces = [frame['data'][i] for frame in frames if i < len(frame.get('data', []))]
+            if len(frame_traces) < len(frames):
+                continue
+            for key in list(trace):
+                if key != 'type' and all(frame_trace.get(key, None) == trace[key] for frame_trace in frame_traces):
+                    for frame_trace in frame_traces:
+                        frame_trace.pop(key, None)
+    return spec
+
+
+def _figure_name(spec):
+    title = spec.get('layout', {}).get('title', {})
+    text = title.get('text') if isinstance(title, dict) else title
+    if text:
+        return re.sub(r'<[^>]+>', '', text.split('<br>')[0]).strip()
+    return ', '.join(sorted({trace.get('type', 'scatter') for trace in spec.get('data', [])}))
+
+
+def plotly_chart(fig, **kwargs):
+    # st.plotly_chart for every chart on the pages: sends the compacted
+    # figure and logs its payload size. kwargs go to st.plotly_chart.
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    payload = pio.to_json(fig, validate=False)
+    spec = compact_figure(json.loads(payload))
+    name = _figure_name(spec)
+    compact = go.Figure(spec, _validate=False)
+    logger.info(
+        "chart %s: %.1f KB (%.1f KB before compaction)",
+        name,
+        len(pio.to_json(compact, validate=False)) / 1024,
+        len(payload) / 1024,
+    )
+    return st.plotly_chart(compact, **kwargs)
@@ -0,0 +1,125 @@
+import itertools
+import logging
+import os
+
+import pandas as pd
+
+from data_loader import dataset_version, read_artifact, shared_resource, write_artifact
+from metrics import get_customer_code_facts, get_customer_month_facts
+from segments import get_segments
+
+CUBE_PATH = "ardiin_erh_cube.pqt"
+
+# Every subset of these is materialized as its own cuboid, so distinct
+# customer counts never have to be rolled up from a finer one.
+DIMENSIONS = ['MONTH_NUM', 'LOYAL_CODE', 'CODE_GROUP', 'User_Segment']
+MEASURES = ['points', 'transactions', 'customers']
+
+logger = logging.getLogger(__name__)
+
+
+def _cuboid_key(dims):
+    return ','.join(d for d in DIMENSIONS if d in dims)
+
+
+def _aggregate(base, dims):
+    if not dims:
+        return pd.DataFrame({
+            'points': [base['Total_Points'].sum()],
+            'transactions': [base['Transaction_Count'].sum()],
+            'customers': [base['CUST_CODE'].nunique()],
+        })
+    return (
+        base.groupby(list(dims), observed=True, dropna=False)
+        .agg(
+            points=('Total_Points', 'sum'),
+            transactions=('Transaction_Count', 'sum'),
+            customers=('CUST_CODE', 'nunique'),
+        )
+        .reset_index()
+    )
+
+
+def build_cube(version):
+    # User_Segment uses the default segment rules and thresholds.
+    facts = get_customer_month_facts(version)
+    segment_map = facts[['MONTH_NUM', 'CUST_CODE']].assign(User_Segment=get_segments(version))
+    base = get_customer_code_facts(version).merge(segment_map, on=['MONTH_NUM', 'CUST_CODE'])
+    month_names = facts.groupby('MONTH_NUM')['MONTH_NAME'].first()
+
+    cuboids = []
+    for r in range(len(DIMENSIONS) + 1):
+        for dims in itertools.combinations(DIMENSIONS, r):
+            cuboid = _aggregate(base, dims)
+            cuboid.insert(0, 'CUBOID', _cuboid_key(dims))
+            if 'MONTH_NUM' in dims:
+                cuboid['MONTH_NAME'] = cuboid['MONTH_NUM'].map(month_names)
+            cuboids.append(cuboid)
+
+    cube = pd.concat(cuboids, ignore_index=True)
+    cube['MONTH_NUM'] = cube['MONTH_NUM'].astype('Int8')
+    for col in ['CUBOID', 'LOYAL_CODE', 'CODE_GROUP', 'User_Segment', 'MONTH_NAME']:
+        cube[col] = cube[col].astype('category')
+    return cube
+
+
+def write_cube(cube, version, path=CUBE_PATH):
+    # Categoricals are written as dictionary-encoded columns.
+    write_artifact(cube, path, version)
+    logger.info("wrote %s cuboid rows to %s (%.1f KB)", len(cube), path, os.path.getsize(path) / 1024)
+
+
+@shared_resource(show_spinner=True)
+def get_cube(version):
+    cube = read_artifact(CUBE_PATH, version)
+    if cube is None:
+        cube = build_cube(version)
+        write_cube(cube, version)
+
+    cuboids = {}
+    for key, part in cube.groupby('CUBOID', observed=True):
+        dims = key.split(',') if key else []
+        columns = dims + (['MONTH_NAME'] if 'MONTH_NUM' in dims else []) + MEASURES
+        cuboids[key] = part[columns].reset_index(drop=True)
+    return cuboids
+
+
+def query(measures, by=(), where=None, version=None):
+    # cube.query(['points', 'customers'], by=['MONTH_NUM'], where={'CODE_GROUP': 'Insurance'})
+    # where values may be a single value or a list. MONTH_NAME comes along
+    # whenever MONTH_NUM is in by.
+    version = version or dataset_version()
+    measures, by, where = list(measures), list(by), dict(where or {})
+
+    unknown = (set(by) | set(where)) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"not a cube dimension: {sorted(unknown)}")
+    unknown = set(measures) - set(MEASURES)
+    if unknown:
+        raise ValueError(f"not a cube measure: {sorted(unknown)}")
+
+    result = get_cube(version)[_cuboid_key(set(by) | set(where))]
+    rolled_up = []
+    for col, value in where.items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        result = result[result[col].isin(values)]
+        if col not in by and len(values) > 1:
+            rolled_up.append(col)
+
+    if rolled_up:
+        if 'customers' in measures:
+            raise ValueError(f"customers is a distinct count and cannot be summed over several {rolled_up} values")
+        keys = by + (['MONTH_NAME'] if 'MONTH_NUM' in by else [])
+        if keys:
+            result = result.groupby(keys, observed=True, dropna=False)[measures].sum().reset_index()
+        else:
+            result = result[measures].sum().to_frame().T
+
+    columns = by + (['MONTH_NAME'] if 'MONTH_NUM' in by else []) + measures
+    return result[columns].sort_values(by).reset_index(drop=True) if by else result[columns].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    version = dataset_version()
+    write_cube(build_cube(version), version)
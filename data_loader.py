@@ -1,27 +1,524 @@
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import threading
+
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATA_PATH = "ardiin_erh_code_grouped.pqt"
+# Hive-style YEAR=/MONTH= layout written by write_partitioned(); used instead
+# of DATA_PATH whenever it exists.
+DATASET_DIR = "ardiin_erh_dataset"
+PARTITION_COLUMNS = ["YEAR", "MONTH"]
+SNAPSHOT_PATH = "ardiin_erh_snapshot.arrow"
+LOOKUP_PATH = "loyalty_lookup_2.csv"
+# The dashboard's window; end is exclusive. Pages key months on MONTH_NUM,
+# so the window is a year from its start unless ARDIIN_ERH_END narrows it.
+DEFAULT_START = os.environ.get("ARDIIN_ERH_START", "2025-01-01")
+DEFAULT_END = os.environ.get("ARDIIN_ERH_END") or f"{pd.Timestamp(DEFAULT_START) + pd.DateOffset(years=1):%Y-%m-%d}"
+
+# The nine columns of the system log export and the kind of arrow type each
+# must have; CODE_GROUP, MONTH_NUM and MONTH_NAME are derived from them.
+SOURCE_SCHEMA = {
+    "TXN_DATE": "date",
+    "TXN_DESC": "string",
+    "JRNO": "integer",
+    "TXN_AMOUNT": "number",
+    "CUST_CODE": "string",
+    "USER_ID": "integer",
+    "NAME": "string",
+    "LOYAL_CODE": "string",
+    "OPER_CODE": "string",
+}
+SOURCE_COLUMNS = list(SOURCE_SCHEMA)
+DERIVED_COLUMNS = ["CODE_GROUP", "MONTH_NUM", "MONTH_NAME"]
+# Low-cardinality string columns that every page groups or filters on.
+DIMENSION_COLUMNS = ["CUST_CODE", "LOYAL_CODE", "CODE_GROUP", "MONTH_NAME", "OPER_CODE", "TXN_DESC", "NAME"]
+MONTH_ORDER = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
+               'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+# "shared" keeps one read-only frame per server process for every session,
+# "session" falls back to st.cache_data's per-call copies.
+CACHE_MODE = os.environ.get("ARDIIN_ERH_CACHE_MODE", "shared")
+
+logger = logging.getLogger(__name__)
+
+if int(pd.__version__.split(".")[0]) < 3:
+    # Copy-on-write is what makes handing out shallow copies of the shared
+    # frame safe; pandas 3 always has it on.
+    pd.set_option("mode.copy_on_write", True)
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def _is_string(field_type):
+    if pa.types.is_dictionary(field_type):
+        field_type = field_type.value_type
+    return pa.types.is_string(field_type) or pa.types.is_large_string(field_type)
+
+
+_TYPE_KINDS = {
+    # String dates are accepted; normalize() parses them.
+    "date": lambda t: pa.types.is_timestamp(t) or pa.types.is_date(t) or _is_string(t),
+    "string": _is_string,
+    "integer": pa.types.is_integer,
+    "number": lambda t: pa.types.is_integer(t) or pa.types.is_floating(t),
+}
+
+
+def schema_problems(schema):
+    problems = [f"missing column {name}" for name in SOURCE_COLUMNS if name not in schema.names]
+    problems += [
+        f"{name} is {schema.field(name).type}, expected {kind}"
+        for name, kind in SOURCE_SCHEMA.items()
+        if name in schema.names and not _TYPE_KINDS[kind](schema.field(name).type)
+    ]
+    return problems
+
+
+def check_schema(schema):
+    problems = schema_problems(schema)
+    if problems:
+        raise SchemaError("; ".join(problems))
+
+
+def _share(obj):
+    # A shallow copy shares the cached column buffers, but any column a page
+    # adds, renames or assigns stays local to that copy.
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.copy(deep=False)
+    if isinstance(obj, tuple):
+        return tuple(_share(o) for o in obj)
+    if isinstance(obj, dict):
+        return dict(obj)
+    return obj
+
+
+def latest_version_only(cached, func):
+    # cached is func under st.cache_*. Its entries are keyed on the dataset
+    # version, so once calls move to a new version the old entries are
+    # cleared instead of staying pinned for the life of the process. A late
+    # call for a retired version (a run that started before the switch) is
+    # computed but not cached.
+    signature = inspect.signature(func)
+    versions = {"current": None, "retired": set()}
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        version = signature.bind(*args, **kwargs).arguments.get("version")
+        with lock:
+            retired = version in versions["retired"]
+            if not retired and version != versions["current"]:
+                if versions["current"] is not None:
+                    versions["retired"].add(versions["current"])
+                    cached.clear()
+                versions["current"] = version
+        return func(*args, **kwargs) if retired else cached(*args, **kwargs)
+
+    wrapper.clear = cached.clear
+    return wrapper
+
+
+def shared_resource(func=None, *, show_spinner=False):
+    if func is None:
+        return functools.partial(shared_resource, show_spinner=show_spinner)
+
+    if CACHE_MODE == "session":
+        return latest_version_only(st.cache_data(show_spinner=show_spinner)(func), func)
 
-@st.cache_data(show_spinner=True)
-def get_df():
-    df = pd.read_parquet(
-        "ardiin_erh_code_grouped.pqt"
+    cached = latest_version_only(st.cache_resource(show_spinner=show_spinner)(func), func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _share(cached(*args, **kwargs))
+
+    wrapper.clear = cached.clear
+    return wrapper
+
+
+def _date_bound(field_type, value):
+    # Filter literals have to match the stored TXN_DATE type for pyarrow to
+    # prune row groups by their min/max statistics.
+    if pa.types.is_timestamp(field_type):
+        return pd.Timestamp(value, tz=field_type.tz).to_pydatetime()
+    if pa.types.is_date(field_type):
+        return pd.Timestamp(value).date()
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def _source_path():
+    return DATASET_DIR if os.path.isdir(DATASET_DIR) else DATA_PATH
+
+
+def source_dataset():
+    if os.path.isdir(DATASET_DIR):
+        return ds.dataset(DATASET_DIR, format="parquet", partitioning="hive")
+    return ds.dataset(DATA_PATH, format="parquet")
+
+
+# (YEAR, MONTH) compared as a pair, written without arithmetic so pyarrow can
+# fold it against each directory's YEAR=/MONTH= values and skip the directory.
+def _months_from(year, month):
+    return (ds.field("YEAR") > year) | ((ds.field("YEAR") == year) & (ds.field("MONTH") >= month))
+
+
+def _months_until(year, month):
+    return (ds.field("YEAR") < year) | ((ds.field("YEAR") == year) & (ds.field("MONTH") <= month))
+
+
+def _date_filter(dataset, start=None, end=None):
+    field_type = dataset.schema.field("TXN_DATE").type
+    partitioned = all(name in dataset.schema.names for name in PARTITION_COLUMNS)
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("TXN_DATE") >= _date_bound(field_type, start))
+        if partitioned:
+            first = pd.Timestamp(start)
+            conditions.append(_months_from(first.year, first.month))
+    if end is not None:
+        conditions.append(ds.field("TXN_DATE") < _date_bound(field_type, end))
+        if partitioned:
+            last = pd.Timestamp(end) - pd.Timedelta(1, "ns")
+            conditions.append(_months_until(last.year, last.month))
+    return functools.reduce(lambda a, b: a & b, conditions) if conditions else None
+
+
+def _scan_source(columns=None, start=None, end=None):
+    # columns / date range are pushed down into the pyarrow scanner: only the
+    # matching partitions are opened, and within them only the projected
+    # columns of row groups whose TXN_DATE statistics overlap are decoded.
+    dataset = source_dataset()
+    check_schema(dataset.schema)
+    if columns is None:
+        # Only the dataset's own columns; a pandas-written file may also carry
+        # its index (__index_level_0__).
+        columns = [name for name in SOURCE_COLUMNS + DERIVED_COLUMNS if name in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=_date_filter(dataset, start, end))
+
+
+def _read_source(columns=None, start=None, end=None):
+    return _scan_source(columns, start, end).to_pandas()
+
+
+def write_partitions(table, dest=DATASET_DIR, **kwargs):
+    dates = pd.to_datetime(table.column("TXN_DATE").to_pandas())
+    table = table.append_column("YEAR", pa.array(dates.dt.year, pa.int16()))
+    table = table.append_column("MONTH", pa.array(dates.dt.month, pa.int8()))
+    ds.write_dataset(
+        table,
+        dest,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([table.schema.field(name) for name in PARTITION_COLUMNS]), flavor="hive"),
+        **kwargs,
     )
+
+
+def write_partitioned(source=DATA_PATH, dest=DATASET_DIR):
+    # One-off conversion of the single-file dataset: python data_loader.py
+    table = pq.read_table(source)
+    write_partitions(table, dest, existing_data_behavior="delete_matching")
+    logger.info("wrote %s rows from %s to %s", table.num_rows, source, dest)
+
+
+def _narrow_numeric(s, floor=None):
+    if pd.api.types.is_float_dtype(s.dtype):
+        # float32 would halve the column but its group totals drift by whole
+        # points, so only fully integral amounts are narrowed.
+        if s.isna().any() or not (s == s.round()).all():
+            return s
+        s = s.astype("int64")
+    s = pd.to_numeric(s, downcast="integer")
+    if floor is not None and s.dtype.itemsize < np.dtype(floor).itemsize:
+        s = s.astype(floor)
+    return s
+
+
+def categorize(df):
+    # Also re-applied after concatenating frames whose categories differ,
+    # which pandas hands back as plain strings.
+    for col in df.columns.intersection(DIMENSION_COLUMNS):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    if "MONTH_NAME" in df.columns:
+        months = df["MONTH_NAME"].cat.categories
+        if months.isin(MONTH_ORDER).all():
+            df["MONTH_NAME"] = df["MONTH_NAME"].cat.set_categories(
+                [m for m in MONTH_ORDER if m in months], ordered=True
+            )
     return df
 
 
-def load_data():
-    df = get_df()
+def normalize(df):
+    before = df.memory_usage(deep=True).sum()
 
-    df = df.loc[df["TXN_DATE"] >= "2025-01-01"].copy()
+    df = categorize(df)
+    for col in df.columns:
+        if col == "TXN_DATE":
+            df[col] = pd.to_datetime(df[col])
+        elif col == "TXN_AMOUNT":
+            # Multi-column groupby aggs hand sums back in the input dtype when
+            # they fit, so amounts keep enough width for arithmetic on totals.
+            df[col] = _narrow_numeric(df[col], floor="int32")
+        elif pd.api.types.is_integer_dtype(df[col].dtype) or pd.api.types.is_float_dtype(df[col].dtype):
+            df[col] = _narrow_numeric(df[col])
 
+    after = df.memory_usage(deep=True).sum()
+    logger.info(
+        "normalized %s rows x %s cols: %.1f MB -> %.1f MB",
+        len(df), len(df.columns), before / 2**20, after / 2**20,
+    )
     return df
 
 
+# path -> (size, mtime_ns, hash) of every data file seen, one entry per file
+# however many partitions and batch files the dataset has.
+_content_hashes = {}
 
-def get_lookup():
 
-    lookup_df = pd.read_csv("loyalty_lookup_2.csv")
-    loyal_code_to_desc = dict(
-        zip(lookup_df["LOYAL_CODE"], lookup_df["TXN_DESC"].str.capitalize())
+def _content_hash(path, size, mtime_ns):
+    # Each file is hashed once per on-disk revision; every later call is a
+    # stat() and a dict lookup.
+    cached = _content_hashes.get(path)
+    if cached is not None and cached[:2] == (size, mtime_ns):
+        return cached[2]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    _content_hashes[path] = (size, mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _data_files(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(path)
+        for name in names
+        if not name.startswith((".", "_"))
     )
-    return loyal_code_to_desc
\ No newline at end of file
+
+
+def dataset_version(path=None):
+    # Cache key for everything derived from the dataset. Cached functions
+    # take this token and skip hashing their DataFrame arguments (_df).
+    # A partitioned dataset folds every file's hash into one token, so adding
+    # or rewriting a partition changes it. The window is part of it too: the
+    # snapshot, the fact state and the cube only hold the window's rows.
+    path = os.path.abspath(path or _source_path())
+    window = f"{DEFAULT_START}:{DEFAULT_END}"
+    files = _data_files(path)
+    if len(files) == 1 and files[0] == path:
+        stat = os.stat(path)
+        content = _content_hash(path, stat.st_size, stat.st_mtime_ns)
+        return f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{content}:{window}"
+
+    digest = hashlib.blake2b(digest_size=16)
+    size, mtime_ns = 0, 0
+    for file in files:
+        stat = os.stat(file)
+        size, mtime_ns = size + stat.st_size, max(mtime_ns, stat.st_mtime_ns)
+        digest.update(f"{os.path.relpath(file, path)}:{_content_hash(file, stat.st_size, stat.st_mtime_ns)}".encode())
+    return f"{path}:{size}:{mtime_ns}:{digest.hexdigest()}:{window}"
+
+
+def read_artifact(path, version):
+    # Derived parquet files (cube, fact state) carry the dataset version they
+    # were built from; a stale or missing file reads as None.
+    if not os.path.exists(path):
+        return None
+    if (pq.read_schema(path).metadata or {}).get(b"dataset_version") != version.encode():
+        return None
+    return pd.read_parquet(path)
+
+
+def write_artifact(df, path, version):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), b"dataset_version": version.encode()}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(version):
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    # The mapped file backs the table's buffers, pages are faulted in as
+    # columns are touched and shared with every process mapping it.
+    table = pa.ipc.open_file(pa.memory_map(SNAPSHOT_PATH)).read_all()
+    if (table.schema.metadata or {}).get(b"dataset_version") != version.encode():
+        return None
+    return table
+
+
+def _build_snapshot(start, end):
+    # Normalized one column at a time off the Arrow scan: pandas only ever
+    # holds one column of the window, and each source column is released
+    # once its normalized copy is built.
+    source = _scan_source(None, start, end)
+    names, columns = source.column_names, []
+    for name in names:
+        df = normalize(source.select([name]).to_pandas())
+        source = source.drop_columns([name])
+        columns.append(pa.Table.from_pandas(df, preserve_index=False).column(0))
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def _write_snapshot(table, version):
+    metadata = {**(table.schema.metadata or {}), b"dataset_version": version.encode()}
+    # Replicas starting together may all write it; each writes its own file
+    # and renames it into place, so readers never see a partial snapshot.
+    tmp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema.with_metadata(metadata)) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, SNAPSHOT_PATH)
+    except OSError:
+        logger.warning("could not write snapshot %s", SNAPSHOT_PATH, exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def read_data(columns=None, start=DEFAULT_START, end=DEFAULT_END):
+    # Uncached: aggregate builders use this so the raw projection they read
+    # is freed once they are done with it.
+    # The default window is served from a normalized, uncompressed Arrow
+    # snapshot written on first read and memory-mapped after that; any other
+    # window (e.g. one month) reads only its own partitions.
+    columns = list(columns) if columns else None
+    if (start, end) != (DEFAULT_START, DEFAULT_END):
+        return normalize(_read_source(columns, start, end))
+
+    version = dataset_version()
+    table = _read_snapshot(version)
+    if table is None:
+        table = _build_snapshot(start, end)
+        # Once written, the built table is dropped for the mapped file.
+        if _write_snapshot(table, version):
+            table = _read_snapshot(version) or table
+
+    # Single-chunk numeric and timestamp columns come back as views of the
+    # mapped buffers; dictionary columns only rebuild their categories.
+    return table.select(columns or table.column_names).to_pandas(split_blocks=True)
+
+
+@shared_resource(show_spinner=True)
+def get_df(version, columns=None, start=None, end=None):
+    return read_data(columns, start, end)
+
+
+def load_data(columns=None, start=DEFAULT_START, end=DEFAULT_END):
+    # end is exclusive: load_data(start="2025-04-01", end="2025-05-01") is April.
+    return get_df(dataset_version(), tuple(columns) if columns else None, start, end)
+
+
+
+def _sorted_quantile(values, counts, q):
+    # Series.quantile's linear interpolation, from sorted distinct values
+    # and their counts instead of the full column.
+    position = (counts.sum() - 1) * q
+    cumulative = np.cumsum(counts)
+    lower = values[np.searchsorted(cumulative, np.floor(position), side="right")]
+    upper = values[np.searchsorted(cumulative, np.ceil(position), side="right")]
+    return lower + (upper - lower) * (position - np.floor(position))
+
+
+def _category_counts(s):
+    codes = s.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(s.cat.categories))
+    return pd.Series(counts, index=s.cat.categories)
+
+
+@shared_resource
+def get_profile(version):
+    # Everything the home page reports, built once per dataset version: the
+    # column count comes from the source schema, everything else from one
+    # value_counts / bincount / min-max per column of the DEFAULT_START
+    # window the pages analyse.
+    dataset = source_dataset()
+
+    df = read_data(columns=["TXN_DATE", "TXN_AMOUNT", "LOYAL_CODE", "CUST_CODE", "OPER_CODE"])
+    amounts = df["TXN_AMOUNT"].value_counts(sort=False).sort_index()
+    values, counts = amounts.index.to_numpy(), amounts.to_numpy()
+    code_rows = _category_counts(df["LOYAL_CODE"])
+
+    return {
+        "columns": len(set(dataset.schema.names) & set(SOURCE_COLUMNS)),
+        "first_date": df["TXN_DATE"].min(),
+        "last_date": df["TXN_DATE"].max(),
+        "window_rows": len(df),
+        "amount_mean": (values * counts).sum() / counts.sum(),
+        "amount_q70": _sorted_quantile(values, counts, 0.7),
+        "amount_max": values[-1],
+        "amount_mode": values[counts.argmax()],
+        "loyal_codes": int((code_rows > 0).sum()),
+        "loyal_code_rows": code_rows,
+        "customers": int((_category_counts(df["CUST_CODE"]) > 0).sum()),
+        "oper_codes": int((_category_counts(df["OPER_CODE"]) > 0).sum()),
+    }
+
+
+def read_lookup():
+    # 'None' is a real code; keep_default_na stops read_csv reading it as NaN.
+    return (
+        pd.read_csv(LOOKUP_PATH, keep_default_na=False)
+        .drop_duplicates("LOYAL_CODE")
+        .set_index("LOYAL_CODE")["TXN_DESC"]
+    )
+
+
+@shared_resource
+def get_loyal_code_dim(version):
+    # One row per LOYAL_CODE category, in category order, so a frame's
+    # LOYAL_CODE codes index straight into DESC and CODE_GROUP.
+    df = read_data(columns=["LOYAL_CODE", "CODE_GROUP"])
+    code_group = df.groupby("LOYAL_CODE", observed=False)["CODE_GROUP"].first()
+    codes = pd.Index(df["LOYAL_CODE"].cat.categories, name="LOYAL_CODE")
+
+    lookup = read_lookup()
+    dim = pd.DataFrame({
+        "DESC": lookup.str.capitalize().reindex(codes).to_numpy(),
+        "CODE_GROUP": code_group.to_numpy(),
+        "IN_LOOKUP": codes.isin(lookup.index),
+    }, index=codes)
+
+    missing = dim.index[~dim["IN_LOOKUP"]]
+    if len(missing):
+        logger.warning("%s LOYAL_CODE values missing from %s: %s", len(missing), LOOKUP_PATH, ", ".join(missing))
+    return dim
+
+
+def missing_lookup_codes(version=None):
+    dim = get_loyal_code_dim(version or dataset_version())
+    return dim.index[~dim["IN_LOOKUP"]].tolist()
+
+
+def describe_codes(codes, column="DESC", version=None):
+    # Replaces .map(dict) on LOYAL_CODE columns: recoding to the dimension's
+    # categories is a no-op for frames read from this dataset, the rest is an
+    # integer take. Codes outside the data come back as NaN.
+    dim = get_loyal_code_dim(version or dataset_version())
+    codes = pd.Series(codes)
+    positions = pd.Categorical(codes, categories=dim.index).codes
+    values = dim[column].to_numpy()[positions]
+    return pd.Series(values, index=codes.index, name=column).where(positions >= 0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    write_partitioned()
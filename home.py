@@ -1,11 +1,14 @@
 import streamlit as st
 import pandas as pd
-from data_loader import load_data, get_df
+from data_loader import dataset_version, get_profile
+from validation import get_validation_report
 
-df = load_data()
+version = dataset_version()
+profile = get_profile(version)
+report = get_validation_report(version)
 
 st.title('АРДЫН ЭРХ ОНООНЫ ДАТАСЕТ ТОВЧ ТАЙЛАН')
-st.caption('Descriptive Analysis Report (2025.01.01 – 2025.12.31)')
+st.caption(f"Descriptive Analysis Report ({profile['first_date']:%Y.%m.%d} – {profile['last_date']:%Y.%m.%d})")
 
 # 1. Executive Summary
 st.markdown("""
@@ -24,8 +27,8 @@ with st.expander('Датасетийн ерөнхий мэдээлэл', expande
     
     st.subheader('Датасетийн бүтэц')
     col1, col2, col3 = st.columns(3)
-    col1.metric(f"Нийт мөрийн тоо", "2,484,682")
-    col2.metric("Баганы тоо", "9")
+    col1.metric(f"Нийт мөрийн тоо", f"{profile['window_rows']:,}")
+    col2.metric("Баганы тоо", str(profile['columns']))
     col3.metric("Эх сурвалж", "Системийн лог")
 
     # Багануудын тайлбар
@@ -45,22 +48,22 @@ with st.expander('Датасетийн ерөнхий мэдээлэл', expande
     
     with analysis_col1:
         st.info("**TXN_AMOUNT (Нэгж Гүйлгээний Оноо)**")
-        st.write(f"* **Дундаж оноо:** {df['TXN_AMOUNT'].mean():.1f}")
-        st.write(f"* **70-р перцентиль:** {df['TXN_AMOUNT'].quantile(0.7)}")
-        st.write(f"* **Хамгийн их:** {df['TXN_AMOUNT'].max()}")
-        st.write(f"* **Хамгийн олон давтагдсан:** {df['TXN_AMOUNT'].mode()[0]}")
+        st.write(f"* **Дундаж оноо:** {profile['amount_mean']:.1f}")
+        st.write(f"* **70-р перцентиль:** {profile['amount_q70']}")
+        st.write(f"* **Хамгийн их:** {profile['amount_max']}")
+        st.write(f"* **Хамгийн олон давтагдсан:** {profile['amount_mode']}")
         
         st.info("**LOYAL_CODE**")
-        st.write(f"* **Өвөрмөц код:** {df.LOYAL_CODE.nunique()}")
-        st.write(f"* **Түгээмэл:** 10K_TRANSACTION {len(df[df['LOYAL_CODE'] == '10K_TRANSACTION']):,}")
+        st.write(f"* **Өвөрмөц код:** {profile['loyal_codes']}")
+        st.write(f"* **Түгээмэл:** 10K_TRANSACTION {profile['loyal_code_rows'].get('10K_TRANSACTION', 0):,}")
 
     with analysis_col2:
         st.info("**CUST_CODE & DATE**")
-        st.write(f"* **Нийт өвөрмөц хэрэглэгч:** {df.CUST_CODE.nunique():,} хэрэглэгч")
-        st.write(f"* **Хугацаа:** 2025.01.01 – 2025.12.31")
+        st.write(f"* **Нийт өвөрмөц хэрэглэгч:** {profile['customers']:,} хэрэглэгч")
+        st.write(f"* **Хугацаа:** {profile['first_date']:%Y.%m.%d} – {profile['last_date']:%Y.%m.%d}")
         
         st.info("**OPER_CODE**")
-        st.write(f"* **Нийт өвөрмөц төлбөрийн сонголт:** {df['OPER_CODE'].nunique()} төрөл")
+        st.write(f"* **Нийт өвөрмөц төлбөрийн сонголт:** {profile['oper_codes']} төрөл")
         #st.write(f"* **Түгээмэл төлбөрийн сонголт :** {df['OPER_CODE'].value_counts().idxmax()}")
 
 # Дата чанарын хэсэг
@@ -70,10 +73,12 @@ with st.expander('3. Өгөгдлийн чанарын үнэлгээ', expanded
     st.markdown(f"""
     * **TXN_DESC:** Зарим тайлбарын багана давхардсан болон стандарт бус тексттэй байсныг зассан.
     * **Cleaning:** Зарим утгуудыг системд оруулахад бэлтгэж цэвэрлэсэн.
-    * **Missing Values:** **{len(df[df['LOYAL_CODE'] == 'None'])}** мөр `LOYAL_CODE`-гүй байсан.
+    * **Missing Values:** **{report['nulls']['LOYAL_CODE'] + report['sentinels']['LOYAL_CODE']}** мөр `LOYAL_CODE`-гүй байсан.
     * **Anomaly:** 
         -   Даатгал болон Данс нээгдсний гүйлгээний оноо **7-р сарын 2** ноос хойш байхгүй болсон.
-        -   **3** гүйлгээ бутархай дүнтэй байсан.
+        -   **{report['fractional_amounts']}** гүйлгээ бутархай дүнтэй байсан.
+        -   **{report['duplicate_jrno']}** гүйлгээ давхардсан `JRNO`-тэй байсан.
+        -   **{len(report['missing_codes'])}** `LOYAL_CODE` тайлбарын хүснэгтэд байхгүй ({report['missing_codes'].sum():,} мөр).
     """)
 
 # Sidebar нэмэлт мэдээлэл
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from cube import build_cube, write_cube
+from data_loader import (
+    DATASET_DIR, DEFAULT_END, DEFAULT_START, PARTITION_COLUMNS,
+    dataset_version, normalize, write_partitioned, write_partitions,
+)
+from metrics import (
+    CODE_KEYS, DAY_KEYS, FACT_COLUMNS, MONTH_KEYS,
+    aggregate_transactions, get_fact_state, merge_deltas, update_facts, write_state,
+)
+from validation import validate_batch
+
+logger = logging.getLogger(__name__)
+
+
+def batch_id(batch):
+    # Content hash of the batch: its files are named after it, so the same
+    # batch sent twice is recognised.
+    hashes = pd.util.hash_pandas_object(batch, index=False).to_numpy()
+    return hashlib.blake2b(hashes.tobytes(), digest_size=8).hexdigest()
+
+
+def is_ingested(batch_id, dest=DATASET_DIR):
+    prefix = f"batch-{batch_id}-"
+    return any(name.startswith(prefix) for _, _, names in os.walk(dest) for name in names)
+
+
+def write_batch(batch, batch_id, dest=DATASET_DIR):
+    # The batch lands as new files in its YEAR=/MONTH= partitions, cast to
+    # the dataset's schema; existing files are never rewritten.
+    schema = ds.dataset(dest, format="parquet", partitioning="hive").schema
+    fields = [field for field in schema if field.name not in PARTITION_COLUMNS]
+    table = pa.Table.from_pandas(batch[[field.name for field in fields]], preserve_index=False)
+    write_partitions(
+        table.cast(pa.schema(fields)),
+        dest,
+        basename_template=f"batch-{batch_id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def append_batch(batch):
+    # Adds a day's transactions and moves the fact state and the cube to the
+    # new dataset version by merging the batch's deltas. A batch that is
+    # already in the dataset (a retried job) is skipped.
+    validate_batch(batch)
+    if not os.path.isdir(DATASET_DIR):
+        write_partitioned()
+
+    name = batch_id(batch)
+    if is_ingested(name):
+        logger.warning("batch %s is already in %s, skipped", name, DATASET_DIR)
+        return dataset_version()
+
+    state = get_fact_state(dataset_version())
+    write_batch(batch, name)
+    version = dataset_version()
+
+    # The facts are keyed by month, not year: rows outside the window are
+    # stored with the dataset but only counted once the window covers them.
+    delta = normalize(batch[FACT_COLUMNS].copy())
+    in_window = (delta['TXN_DATE'] >= pd.Timestamp(DEFAULT_START)) & (delta['TXN_DATE'] < pd.Timestamp(DEFAULT_END))
+    if not in_window.all():
+        logger.warning("%s rows outside %s – %s left out of the facts", int((~in_window).sum()), DEFAULT_START, DEFAULT_END)
+    delta = delta[in_window]
+    code_delta, day_delta = aggregate_transactions(delta)
+    touched = pd.MultiIndex.from_frame(code_delta[MONTH_KEYS].drop_duplicates())
+
+    code_facts = merge_deltas(state['code_facts'], code_delta, CODE_KEYS, touched)
+    customer_days = merge_deltas(state['customer_days'], day_delta, DAY_KEYS, touched)
+    facts = update_facts(state['facts'], code_facts, customer_days, touched)
+    write_state({'code_facts': code_facts, 'customer_days': customer_days, 'facts': facts}, version)
+
+    # Segment thresholds are quantiles over every customer-month, so the
+    # cube is rebuilt, but from the merged state rather than the raw year.
+    write_cube(build_cube(version), version)
+    logger.info("appended %s rows, %s customer-months updated", len(batch), len(touched))
+    return version
+
+
+if __name__ == "__main__":
+    # python ingest.py batch.pqt [batch.pqt ...]
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for path in sys.argv[1:]:
+        append_batch(pd.read_parquet(path))
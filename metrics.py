@@ -0,0 +1,219 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import categorize, read_artifact, read_data, shared_resource, write_artifact
+
+FACT_COLUMNS = ['CUST_CODE', 'MONTH_NUM', 'MONTH_NAME', 'TXN_DATE', 'LOYAL_CODE', 'CODE_GROUP', 'TXN_AMOUNT', 'JRNO']
+
+MONTH_KEYS = ['MONTH_NUM', 'CUST_CODE']
+CODE_KEYS = ['MONTH_NUM', 'CUST_CODE', 'LOYAL_CODE', 'CODE_GROUP']
+DAY_KEYS = ['MONTH_NUM', 'MONTH_NAME', 'CUST_CODE', 'TXN_DATE']
+
+# Version-stamped copies of the fact state, so a restart or a daily batch
+# (ingest.py) starts from these instead of the raw year.
+STATE_DIR = "ardiin_erh_aggregates"
+STATE_TABLES = ['code_facts', 'customer_days', 'facts']
+
+# Total_Points bins of the page1 point-distribution chart.
+POINTS_BINS = {'start': 0, 'end': 3500.0, 'size': 25}
+
+# Most outliers a box plot ships; past this a sample that keeps both
+# extremes is drawn.
+MAX_BOX_OUTLIERS = 500
+
+
+def get_dominant(df, keys, column, weight=None):
+    # Vectorized "x.mode().iloc[0]" per group: count (keys, column) pairs and
+    # take the argmax per key. The counts come back sorted by column within
+    # each key and idxmax keeps the first maximum, so ties go to the
+    # smallest value (category order for categoricals), same as mode().
+    # weight sums a count column instead, for frames that are already
+    # aggregated.
+    grouped = df.groupby(keys + [column], observed=True)
+    counts = grouped.size() if weight is None else grouped[weight].sum()
+    counts = counts.reset_index(name='_count')
+    top = counts.loc[counts.groupby(keys, observed=True)['_count'].idxmax()]
+    return top.set_index(keys)[column]
+
+
+def aggregate_transactions(df):
+    # The two additive tables every customer-month fact is derived from:
+    # per-code sums/counts and the distinct transaction dates.
+    # Rows without a LOYAL_CODE or CODE_GROUP still count toward the
+    # customer-month totals.
+    code_facts = (
+        df.groupby(CODE_KEYS, observed=True, dropna=False)
+        .agg(
+            Total_Points=('TXN_AMOUNT', 'sum'),
+            Transaction_Count=('JRNO', 'size'),
+        )
+        .reset_index()
+    )
+    customer_days = (
+        df.groupby(DAY_KEYS, observed=True, dropna=False)
+        .size()
+        .reset_index(name='Transaction_Count')
+    )
+    return code_facts, customer_days
+
+
+def build_facts(code_facts, customer_days):
+    by_code = code_facts.groupby(MONTH_KEYS, observed=True).agg(
+        Total_Points=('Total_Points', 'sum'),
+        Transaction_Count=('Transaction_Count', 'sum'),
+        Unique_Loyal_Codes=('LOYAL_CODE', 'nunique'),
+    )
+    by_day = customer_days.groupby(MONTH_KEYS, observed=True).agg(
+        MONTH_NAME=('MONTH_NAME', 'first'),
+        Active_Days=('TXN_DATE', 'count'),
+        First_Date=('TXN_DATE', 'min'),
+        Last_Date=('TXN_DATE', 'max'),
+    )
+
+    facts = by_day[['MONTH_NAME']].join(by_code).join(by_day.drop(columns='MONTH_NAME'))
+    facts['Dominant_Code_Group'] = get_dominant(code_facts, MONTH_KEYS, 'CODE_GROUP', weight='Transaction_Count')
+    facts = facts.reset_index()
+
+    facts['Reached_1000_Flag'] = (facts['Total_Points'] >= 1000).astype(int)
+    facts['Inactive'] = (facts['Transaction_Count'] <= 1).astype(int)
+
+    return facts
+
+
+def _touched(frame, keys):
+    return pd.MultiIndex.from_frame(frame[MONTH_KEYS]).isin(keys)
+
+
+def merge_deltas(table, delta, keys, touched):
+    # Only rows of the customer-months in the delta are regrouped; the rest
+    # of the table is carried over as is.
+    mask = _touched(table, touched)
+    measures = [col for col in table.columns if col not in keys]
+    merged = (
+        categorize(pd.concat([table[mask], delta], ignore_index=True))
+        .groupby(keys, observed=True, dropna=False)[measures]
+        .sum()
+        .reset_index()
+    )
+    return categorize(pd.concat([table[~mask], merged], ignore_index=True))
+
+
+def update_facts(facts, code_facts, customer_days, touched):
+    fresh = build_facts(code_facts[_touched(code_facts, touched)], customer_days[_touched(customer_days, touched)])
+    facts = categorize(pd.concat([facts[~_touched(facts, touched)], fresh], ignore_index=True))
+    facts['Dominant_Code_Group'] = facts['Dominant_Code_Group'].astype('category')
+    return facts.sort_values(MONTH_KEYS, ignore_index=True)
+
+
+def read_state(version):
+    state = {name: read_artifact(os.path.join(STATE_DIR, f'{name}.pqt'), version) for name in STATE_TABLES}
+    return None if any(table is None for table in state.values()) else state
+
+
+def write_state(state, version):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    for name in STATE_TABLES:
+        write_artifact(state[name], os.path.join(STATE_DIR, f'{name}.pqt'), version)
+
+
+@shared_resource(show_spinner=True)
+def get_fact_state(version):
+    state = read_state(version)
+    if state is None:
+        code_facts, customer_days = aggregate_transactions(read_data(columns=FACT_COLUMNS))
+        state = {
+            'code_facts': code_facts,
+            'customer_days': customer_days,
+            'facts': build_facts(code_facts, customer_days),
+        }
+        write_state(state, version)
+    return state
+
+
+# One row per customer and month. Every page's CUST_CODE x MONTH_NUM
+# aggregation reads from this table instead of grouping the raw frame.
+@shared_resource
+def get_customer_month_facts(version):
+    return get_fact_state(version)['facts']
+
+
+def get_monthly_customer_points(version):
+    facts = get_customer_month_facts(version)
+    return facts[['MONTH_NUM', 'MONTH_NAME', 'CUST_CODE', 'Total_Points']]
+
+
+# One row per customer, month and LOYAL_CODE: the finest grain any page
+# needs below the raw transactions (per-code shares, segment x code sums).
+@shared_resource
+def get_customer_code_facts(version):
+    return get_fact_state(version)['code_facts']
+
+
+# Customers per Total_Points bin and month, binned here so a histogram chart
+# ships bin counts instead of every customer-month. Bins are
+# [start + i*size, start + (i+1)*size) up to end; points outside are
+# dropped, as plotly's xbins does.
+@shared_resource
+def get_points_histogram(version, start, end, size):
+    facts = get_customer_month_facts(version)
+    edges = np.arange(start, end + size, size)
+    n_bins = len(edges) - 1
+
+    points = facts['Total_Points'].to_numpy()
+    months = facts['MONTH_NUM'].to_numpy()
+    bins = np.floor((points - start) / size).astype(np.int64)
+    keep = (points >= start) & (bins < n_bins)
+
+    month_nums = np.unique(months)
+    month_idx = np.searchsorted(month_nums, months[keep])
+    counts = np.bincount(month_idx * n_bins + bins[keep], minlength=len(month_nums) * n_bins)
+
+    names = facts.drop_duplicates('MONTH_NUM').set_index('MONTH_NUM')['MONTH_NAME']
+    return pd.DataFrame({
+        'MONTH_NUM': np.repeat(month_nums, n_bins),
+        'MONTH_NAME': names.loc[np.repeat(month_nums, n_bins)].array,
+        'Bin_Start': np.tile(edges[:-1], len(month_nums)),
+        'Bin_End': np.tile(edges[1:], len(month_nums)),
+        'count': counts,
+    })
+
+
+def box_stats(values, max_outliers=MAX_BOX_OUTLIERS, seed=0):
+    # What plotly computes in the browser for a box trace: linear-method
+    # quartiles, whiskers at the furthest values within 1.5 IQR, and the
+    # values beyond them as outliers.
+    values = np.sort(np.asarray(values, dtype=float))
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return dict.fromkeys(['q1', 'median', 'q3', 'lowerfence', 'upperfence', 'mean'], np.nan) | {'outliers': values, 'count': 0}
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < inside[0]) | (values > inside[-1])]
+    if len(outliers) > max_outliers:
+        rng = np.random.default_rng(seed)
+        keep = rng.choice(np.arange(1, len(outliers) - 1), max_outliers - 2, replace=False)
+        outliers = outliers[np.sort(np.concatenate([[0, len(outliers) - 1], keep]))]
+
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': inside[0],
+        'upperfence': inside[-1],
+        'mean': values.mean(),
+        'outliers': outliers,
+        'count': len(values),
+    }
+
+
+@shared_resource
+def get_achiever_box_stats(version):
+    facts = get_customer_month_facts(version)
+    achievers = facts[facts['Reached_1000_Flag'] == 1]
+    return {
+        column: box_stats(achievers[column].to_numpy())
+        for column in ['Transaction_Count', 'Active_Days', 'Unique_Loyal_Codes']
+    }
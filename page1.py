@@ -5,7 +5,9 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-from data_loader import load_data
+from data_loader import shared_resource, dataset_version
+from metrics import get_customer_month_facts, get_monthly_customer_points, get_points_histogram, POINTS_BINS
+from charts import bar_plot_h, binned_histogram, cached_figure, plotly_chart
 
 #[theme]
 #base="dark"
@@ -14,40 +16,14 @@ from data_loader import load_data
 
 # Functions 
 
-@st.cache_data(show_spinner=False)
-def get_monthly_customer_points(df):
-    monthly_customer_points = (
-        df.groupby(
-            ['MONTH_NUM', 'MONTH_NAME', 'CUST_CODE'],
-            observed=True
-        )['TXN_AMOUNT']
-        .sum()
-        .reset_index()
-    )
-    monthly_customer_points.rename(columns={'TXN_AMOUNT' : 'Total_Points'}, inplace=True)
-
-    return monthly_customer_points
-
-@st.cache_data(show_spinner=False)
-def get_freq(df):
-
-    cust_freq = df.groupby(
-            ['MONTH_NUM', 'MONTH_NAME', 'CUST_CODE'],
-            observed=True
-        )['JRNO'].count().reset_index()
-    
-    cust_freq.rename(columns={'JRNO' : 'Total_Freq'}, inplace=True)
-
-    return cust_freq     
-
-@st.cache_data(show_spinner=False)
-def get_reached_1000_df(monthly_customer_points):
-    monthly_customer_points = monthly_customer_points.copy()
+@shared_resource
+def get_reached_1000_df(_monthly_customer_points, version):
+    monthly_customer_points = _monthly_customer_points.copy()
     monthly_customer_points['REACHED_1000'] = monthly_customer_points['Total_Points'] >= 1000
     monthly_customer_points['DID_NOT_REACH_1000'] = monthly_customer_points['Total_Points'] < 1000
 
     # 2. Group by month and sum the flags to get the counts
-    reached_1000_df = monthly_customer_points.groupby(['MONTH_NAME'],as_index=False).agg({
+    reached_1000_df = monthly_customer_points.groupby(['MONTH_NAME'],as_index=False, observed=True).agg({
         'REACHED_1000': 'sum',
         'DID_NOT_REACH_1000': 'sum'
     }).rename(columns={
@@ -68,58 +44,102 @@ def get_reached_1000_df(monthly_customer_points):
     reached_1000_df = reached_1000_df.rename(columns={'MONTH_NAME' : 'Сар'})
     return reached_1000_df
 
-def bar_plot_h(df, x, y, selected_month):
-    fig = px.bar(
-        df,
-        x=x, 
-        y=y,
-        orientation='h',
-        labels={x: 'Value', y: 'Category'}, 
-        color=x,
-        text='Percentage',
-        color_continuous_scale='Blues', 
-        template='plotly_white',  
+@cached_figure
+def build_points_histogram_fig(version):
+    y_max = get_monthly_customer_points(version).groupby('MONTH_NAME', observed=True) \
+        .size().max()
+
+    fig = binned_histogram(
+        get_points_histogram(version, **POINTS_BINS),
+        log_y=True,
+        title=f'<b>Хэрэглэгчдийн Онооны Тархалт (Сараар)</b>',
+        labels={'Bin_Center': 'Total Points Accumulated', 'count': 'Number of Customers'},
+        color_discrete_sequence=['#636EFA'], 
+        template='plotly_white',
+        animation_frame='MONTH_NAME',
     )
 
+
+    # Refine the visual polish
     fig.update_traces(
-        textposition='outside', 
-        cliponaxis=False,        
-        textfont_size=16,   
+        marker_line_width=1, 
+        marker_line_color="white", # Separation between bars
+        opacity=0.85,
     )
 
-    # Combine layout updates into one block
     fig.update_layout(
-        height=500,
-        coloraxis_showscale=False,
-        margin=dict(r=100), # Increased margin for larger % labels
-        title=dict(
-            text=f'<b>{selected_month}-р сарын хэрэглэгчдийн онооны хувиарлалт </b>',
-            font=dict(size=24)
-        ),
+        bargap=0.05,              # Small gap 
+        xaxis_title="<b>Оноо</b>",
+        yaxis_title="<b>Хэрэглэгчдийн нийт тоо (Log Scale)</b>",
+        hovermode='x unified',
+        height = 500,
+        autosize=False,
+        #frame={'duration': 800, 'redraw': False},
+        transition={'duration': 1000},
+        title={
+            'text': '<b>Хэрэглэгчдийн Онооны Тархалт (Сараар)</b>',
+            'y': 0.95,           # Vertically adjusts (1.0 is top)
+            'x': 0.5,            # Horizontally sets to 50%
+            'xanchor': 'center', # Anchors the title's center to the x coordinate
+            'yanchor': 'top',
+            'font': dict(size=24)
+        },
         xaxis=dict(
-            title_text="<b>Нийт хэрэглэгчдийн тоо </b>",
             title_font=dict(size=18),
             tickfont=dict(size=14)
         ),
         yaxis=dict(
-            title_text="<b>Онооны хэсгүүд</b>",
             title_font=dict(size=18),
             tickfont=dict(size=14)
         )
     )
 
+    # Add shapes
+    fig.add_shape(type="rect",
+        xref="x", yref="y",
+        x0=1000, y0=10000,
+        x1=3500, y1=0,
+        line=dict(
+            color="darkgreen",
+            width=3,
+        ),
+        fillcolor="darkseagreen",
+        opacity=0.2
+    )
+
+    fig.add_shape(type="rect",
+        xref="x", yref="y",
+        x0=1000, y0=10000,
+        x1=3500, y1=0,
+        line=dict(
+            color="darkgreen",
+            width=3,
+        ),
+        fillcolor="darkseagreen",
+        opacity=0.05,
+        label=dict(text="1000 оноо хүрсэн", textposition="top right", font=dict(size=20)),
+
+    )
+
+    fig.update_yaxes(
+    type="log",
+    range=[0, np.log10(y_max) + 0.5],
+    autorange=False,
+    fixedrange=True
+    )
+
+    fig.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = 800
+    fig.layout.updatemenus[0].buttons[0].args[1]['transition']['duration'] = 1000
+
     return fig
 
 # Data Load 
-@st.cache_data(show_spinner=False)
-def load_base():
-    return load_data()
-
-df = load_base()
+version = dataset_version()
 
-monthly_customer_points = get_monthly_customer_points(df)
-cust_freq = get_freq(df)
-reached_1000_df = get_reached_1000_df(monthly_customer_points)
+monthly_customer_points = get_monthly_customer_points(version)
+cust_freq = get_customer_month_facts(version)[['MONTH_NUM', 'MONTH_NAME', 'CUST_CODE', 'Transaction_Count']] \
+    .rename(columns={'Transaction_Count': 'Total_Freq'})
+reached_1000_df = get_reached_1000_df(monthly_customer_points, version)
 
 # Global widgets 
 months = (
@@ -192,7 +212,7 @@ with tab3:
     fig.update_yaxes(secondary_y=True, range=[0, max_pct * 1.2])
 
     st.subheader("2025 ОНЫ 1000 ОНООНЫ БОСГО ДАВСАН ХЭРЭГЛЭГЧДИЙН ШИНЖИЛГЭЭ")
-    st.plotly_chart(fig)
+    plotly_chart(fig)
 
     with st.expander(expanded=True,label= 'Тайлбар:'):
 
@@ -268,98 +288,7 @@ with tab3:
 
 
     with st.expander("Хэрэглэгчдийн онооны тархалтыг харах:", expanded=False):
-        y_max = monthly_customer_points.groupby('MONTH_NAME') \
-            .size().max()
-        
-        fig = px.histogram(
-            #filtered_df,
-            monthly_customer_points, 
-            x='Total_Points',
-            #nbins=30, 
-            log_y=True,
-            title=f'<b>Хэрэглэгчдийн Онооны Тархалт (Сараар)</b>',
-            labels={'Total_Points': 'Total Points Accumulated', 'count': 'Number of Customers'},
-            color_discrete_sequence=['#636EFA'], 
-            template='plotly_white',
-            #animation_group='Total_Points',
-            animation_frame='MONTH_NAME',
-            
-        )
-        
-
-        # Refine the visual polish
-        fig.update_traces(
-            marker_line_width=1, 
-            marker_line_color="white", # Separation between bars
-            opacity=0.85,
-            xbins=dict(start=0, end=3500.0, size=25)
-        )
-
-        fig.update_layout(
-            bargap=0.05,              # Small gap 
-            xaxis_title="<b>Оноо</b>",
-            yaxis_title="<b>Хэрэглэгчдийн нийт тоо (Log Scale)</b>",
-            hovermode='x unified',
-            height = 500,
-            autosize=False,
-            #frame={'duration': 800, 'redraw': False},
-            transition={'duration': 1000},
-            title={
-                'text': '<b>Хэрэглэгчдийн Онооны Тархалт (Сараар)</b>',
-                'y': 0.95,           # Vertically adjusts (1.0 is top)
-                'x': 0.5,            # Horizontally sets to 50%
-                'xanchor': 'center', # Anchors the title's center to the x coordinate
-                'yanchor': 'top',
-                'font': dict(size=24)
-            },
-            xaxis=dict(
-                title_font=dict(size=18),
-                tickfont=dict(size=14)
-            ),
-            yaxis=dict(
-                title_font=dict(size=18),
-                tickfont=dict(size=14)
-            )
-        )
-
-        # Add shapes
-        fig.add_shape(type="rect",
-            xref="x", yref="y",
-            x0=1000, y0=10000,
-            x1=3500, y1=0,
-            line=dict(
-                color="darkgreen",
-                width=3,
-            ),
-            fillcolor="darkseagreen",
-            opacity=0.2
-        )
-
-        fig.add_shape(type="rect",
-            xref="x", yref="y",
-            x0=1000, y0=10000,
-            x1=3500, y1=0,
-            line=dict(
-                color="darkgreen",
-                width=3,
-            ),
-            fillcolor="darkseagreen",
-            opacity=0.05,
-            label=dict(text="1000 оноо хүрсэн", textposition="top right", font=dict(size=20)),
-
-        )
-        
-        fig.update_yaxes(
-        type="log",
-        range=[0, np.log10(y_max) + 0.5],
-        autorange=False,
-        fixedrange=True
-        )
-
-        fig.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = 800
-        fig.layout.updatemenus[0].buttons[0].args[1]['transition']['duration'] = 1000
-
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(build_points_histogram_fig(version), use_container_width=True)
 
 
     with st.expander(label='Хүснэгт харах:', expanded=False):
@@ -417,7 +346,7 @@ with tab2:
             'x' : 0.5
         },
     )
-    st.plotly_chart(heat_fig, use_container_width=True)
+    plotly_chart(heat_fig, use_container_width=True)
 
     with st.expander("Тайлбар", expanded=True):
 
@@ -495,38 +424,44 @@ with tab2:
         # )
 
     
-    with st.expander('Сар тус бүрээр харах:', expanded=False):
+    # Only this expander reruns when the month changes; its inputs are the
+    # cached customer-month points.
+    @st.fragment
+    def month_segments(monthly_customer_points, months):
+        with st.expander('Сар тус бүрээр харах:', expanded=False):
         
-        selected_month = st.selectbox(
-            'Choose a month to analyze',
-            options=months['MONTH_NUM'],
-            key='tab2'
-        )
+            selected_month = st.selectbox(
+                'Choose a month to analyze',
+                options=months['MONTH_NUM'],
+                key='tab2'
+            )
 
-        filtered_df = monthly_customer_points[monthly_customer_points['MONTH_NUM'] == selected_month]
-        segments = pd.cut(filtered_df['Total_Points'], bins=bins, labels=labels, right=False)
-        segment_counts = segments.value_counts().sort_index()
-        segment_counts = segment_counts.to_frame().reset_index()
-        segment_counts.columns = ['Segments', 'Counts']
+            filtered_df = monthly_customer_points[monthly_customer_points['MONTH_NUM'] == selected_month]
+            segments = pd.cut(filtered_df['Total_Points'], bins=bins, labels=labels, right=False)
+            segment_counts = segments.value_counts().sort_index()
+            segment_counts = segment_counts.to_frame().reset_index()
+            segment_counts.columns = ['Segments', 'Counts']
 
-        total_customers = segment_counts['Counts'].sum()
-        segment_counts['Percentage'] = (segment_counts['Counts'] / total_customers * 100).round(1)
-        segment_counts['Percentage'] = segment_counts['Percentage'].astype(str) + '%'
+            total_customers = segment_counts['Counts'].sum()
+            segment_counts['Percentage'] = (segment_counts['Counts'] / total_customers * 100).round(1)
+            segment_counts['Percentage'] = segment_counts['Percentage'].astype(str) + '%'
 
 
-        fig = bar_plot_h(df=segment_counts, 
-                x = 'Counts', 
-                y = 'Segments', 
-                selected_month=selected_month
-        )
-        st.plotly_chart(fig)
+            fig = bar_plot_h(df=segment_counts, 
+                    x = 'Counts', 
+                    y = 'Segments', 
+                    selected_month=selected_month
+            )
+            plotly_chart(fig)
+
+    month_segments(monthly_customer_points, months)
 
     with st.expander(label = 'Хүснэгт харах:',expanded=False):
         st.dataframe(segment_counts_all, hide_index=True, use_container_width=True)
 
 with tab1:
     #st.dataframe(cust_freq)
-    monthly_total_points_df = monthly_customer_points.groupby(['MONTH_NUM','MONTH_NAME'])['Total_Points'].sum().reset_index()
+    monthly_total_points_df = monthly_customer_points.groupby(['MONTH_NUM','MONTH_NAME'], observed=True)['Total_Points'].sum().reset_index()
     #monthly_total_points_df['Total_Points'] = monthly_total_points_df['Total_Points'].round(0)
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
@@ -549,8 +484,8 @@ with tab1:
 
     # Line: Unique Users (right axis)
     monthly_user_num = (
-        df
-        .groupby(['MONTH_NUM', 'MONTH_NAME'])['CUST_CODE']
+        monthly_customer_points
+        .groupby(['MONTH_NUM', 'MONTH_NAME'], observed=True)['CUST_CODE']
         .nunique()
         .reset_index()
     )
@@ -596,7 +531,7 @@ with tab1:
 
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
 
     merged_monthly_user_point = pd.merge(
             left=monthly_total_points_df,
@@ -612,8 +547,8 @@ with tab1:
         st.subheader("Ерөнхий тойм")
 
         st.markdown(f"""
-        - 2025 оны **1–12** дугаар саруудад нийт **{df['CUST_CODE'].nunique():,}** хэрэглэгч урамшууллын хөтөлбөрт хамрагдсан байна.
-        - Сард дунджаар **{df.groupby('MONTH_NUM')['CUST_CODE'].nunique().mean():,.0f}** хэрэглэгч урамшуулалд оролцсон байна.
+        - 2025 оны **1–12** дугаар саруудад нийт **{monthly_customer_points['CUST_CODE'].nunique():,}** хэрэглэгч урамшууллын хөтөлбөрт хамрагдсан байна.
+        - Сард дунджаар **{monthly_customer_points.groupby('MONTH_NUM')['CUST_CODE'].nunique().mean():,.0f}** хэрэглэгч урамшуулалд оролцсон байна.
         """)
 
         st.divider()
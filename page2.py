@@ -1,16 +1,13 @@
 import streamlit as st
-from data_loader import load_data, get_lookup
-from page1 import bar_plot_h
+from data_loader import describe_codes, shared_resource, dataset_version
+from cube import query
+from charts import cached_figure, donut_plot, plotly_chart, trajectory_plot
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import math
 
-@st.cache_data(show_spinner=False)
-def load_base():
-    return load_data(), get_lookup()
-
-df, loyal_code_to_desc = load_base()
+version = dataset_version()
 
 tab1, tab2, tab3, tab4 = st.tabs(["Methodology", "ГҮЙЛГЭЭНИЙ ОНООНЫ ТАРХАЦ", 'ГҮЙЛГЭЭНИЙ ТӨРЛИЙН ШИНЖИЛГЭЭ (БҮЛЭГЛЭСЭН)', 'ГҮЙЛГЭЭНИЙ ШИНЖИЛГЭЭ'])
 month_order = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 
@@ -18,34 +15,28 @@ month_order = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
 
 
 # Total Points by Reward group
-@st.cache_data(show_spinner=False)
-def get_grouped_reward():
-    grouped_reward = df.groupby(['CODE_GROUP','MONTH_NUM', 'MONTH_NAME'])['TXN_AMOUNT'].sum().reset_index()
-    grouped_reward.rename(columns = {'TXN_AMOUNT': 'TOTAL_AMOUNT'}, inplace=True)
+@shared_resource
+def get_grouped_reward(version):
+    grouped_reward = query(['points'], by=['CODE_GROUP', 'MONTH_NUM'], version=version)
+    grouped_reward.rename(columns = {'points': 'TOTAL_AMOUNT'}, inplace=True)
     return grouped_reward
 
 
-@st.cache_data(show_spinner=False)
-def build_transaction_summary(df, lookup):
-    ts = (
-        df.groupby(
-            ['LOYAL_CODE', 'MONTH_NAME', 'MONTH_NUM', 'CODE_GROUP'],
-            observed=True
-        )
-        .agg(
-            Transaction_Freq=('JRNO', 'size'),
-            Total_Users=('CUST_CODE', 'nunique'),
-            Total_Amount=('TXN_AMOUNT', 'sum')
-        )
-        .reset_index()
-    )
-    ts['DESC'] = ts['LOYAL_CODE'].map(lookup)
+@shared_resource
+def build_transaction_summary(version):
+    ts = query(['transactions', 'customers', 'points'], by=['LOYAL_CODE', 'MONTH_NUM', 'CODE_GROUP'], version=version)
+    ts = ts.rename(columns={
+        'transactions': 'Transaction_Freq',
+        'customers': 'Total_Users',
+        'points': 'Total_Amount',
+    })[['LOYAL_CODE', 'MONTH_NAME', 'MONTH_NUM', 'CODE_GROUP', 'Transaction_Freq', 'Total_Users', 'Total_Amount']]
+    ts['DESC'] = describe_codes(ts['LOYAL_CODE'], version=version)
     return ts
 
-@st.cache_data(show_spinner=False)
-def build_animation_fig(transaction_summary):
+@cached_figure
+def build_animation_fig(_transaction_summary, version):
     fig = px.scatter(
-        transaction_summary,
+        _transaction_summary,
         x='Total_Users',
         y='Total_Amount',
         size='Transaction_Freq',
@@ -58,104 +49,6 @@ def build_animation_fig(transaction_summary):
         category_orders={'MONTH_NAME': month_order},
         color_discrete_sequence=px.colors.qualitative.Vivid,
     )
-    return fig
-
-
-transaction_summary = build_transaction_summary(df, loyal_code_to_desc)
-
-grouped_reward = get_grouped_reward()
-
-
-def donut_plot(df, labels_col, values_col, title_text=""):
-    fig = go.Figure(data=[go.Pie(
-        labels=df[labels_col], 
-        values=df[values_col], 
-        hole=.6,              
-        marker=dict(line=dict(color='#FFFFFF', width=2)), # White borders between slices
-        hoverinfo='label+percent+value',
-        textinfo='percent',    
-        textfont_size=16,
-    )])
-
-    fig.update_layout(
-        title=dict(
-            text=f"<b>{title_text}</b>",
-            #x=0.5,            
-            font=dict(size=24)
-        ),
-        height=500,            
-        width=800,             
-        
-        # CLEANING UP
-        template='plotly_white',
-        showlegend=True,
-        legend=dict(
-            orientation="h",   
-            yanchor="bottom",
-            y=-0.2,            
-            xanchor="center",
-            x=0.5,
-            font=dict(size=14)
-        ),
-        #"Donut Hole" text
-        annotations=[dict(text='Total', x=0.5, y=0.5, font_size=20, showarrow=False)]
-    )
-    
-    return fig
-
-with tab1:
-    with st.expander("Гүйлгээний ангиллын аргачлал", expanded=True):
-        st.markdown(
-            """
-            ### Гүйлгээний ангиллын тайлбар
-
-            Энэхүү хуудсанд харуулах гүйлгээнүүдийн ангилалыг датасетын **`LOYAL_CODE`** дээр үндэслэн бизнесийн утга агуулгаар нь бүлэглэн ангилав.
-            Ангиллын зорилго нь хэрэглэгчдийн оноо цуглуулах үйл ажиллагааг **товчоор, ойлгомжтой** байдлаар нэгтгэхэд оршино.
-
-            #### Ангиллын үндсэн зарчим
-
-            **1. Санхүүгийн гүйлгээ (Financial Transactions)**  
-            Мөнгө шилжүүлэлт, төлбөр, зээлийн эргэн төлөлт болон картын гүйлгээнүүд.  
-
-            **2. Данс нээлт (Account Opening)**  
-            Хадгаламж, үнэт цаас, тэтгэврийн болон бусад данс нээхтэй холбоотой урамшууллууд.  
-
-            **3. Хөрөнгө оруулалт ба үнэт цаас (Investments & Securities)**  
-            Хувьцаа, crypto, арилжаа, 1072 хувьцаа болон хөрөнгө оруулалтын гүйлгээнүүд.  
-
-            **4. Худалдаа, өдөр тутмын хэрэглээ (Merchant & Lifestyle)**  
-            Худалдааны түнш, сугалаа, бараа үйлчилгээтэй холбоотой гүйлгээнүүд.  
-
-            **5. Даатгал (Insurance)**  
-            Даатгалын бүтээгдэхүүн болон даатгалтай холбоотой урамшуулалууд.  
-
-            **6. Урамшуулалын аян, арга хэмжээ (Campaigns & Events)**  
-            Маркетингийн кампанит ажил, Investor Week, сургалт, эвентүүд.  
-
-            **7. Social оролцоо (Social & Engagement)**  
-            Сошиал идэвхжил, мэдээлэл унших, селфи, контент хуваалцах үйлдлүүд.  
-
-            **8. Бүс нутгийн аян (Geographic Campaigns)**  
-            Тодорхой аймаг, хотод чиглэсэн кампанит ажлууд.
-            """,
-    )
-        st.dataframe(df.groupby('CODE_GROUP')['LOYAL_CODE'].unique(), use_container_width=True)
-    
-with tab2:
-
-    transaction_summary.columns = ['LOYAL_CODE', 'MONTH_NAME', 'MONTH_NUM','GROUP','Transaction_Freq','Total_Users', 'Total_Amount', 'DESC']
-
-    significant_movers = [
-        '10K_TRANSACTION_CARD',
-        '10K_CHARGE_SAVINGS2',
-        '10K_GET_LOTTO',
-        '10K_CHARGE_LIFE_OLD',
-    ]
-
-    transaction_summary['MOVERS'] = transaction_summary['LOYAL_CODE'].isin(significant_movers)
-    movers_df = transaction_summary[transaction_summary['MOVERS'] == True]
-
-    fig = build_animation_fig(transaction_summary)
     fig.update_traces(
         marker=dict(
             line=dict(width=1, color='white'),
@@ -163,8 +56,6 @@ with tab2:
         )
     )
 
-
-
     # Animation Smoothness 
     fig.update_layout(
         updatemenus=[{
@@ -214,7 +105,7 @@ with tab2:
             tickfont=dict(size=14)
         )
     )
-    
+
     fig.add_annotation(
         text= 'Гүйлгээний давтамжийн тоог дүрсийн хэмжээгээр илэрхийлэв',
         showarrow=False,
@@ -225,7 +116,68 @@ with tab2:
             color="grey"
         )
     )
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+
+transaction_summary = build_transaction_summary(version)
+
+grouped_reward = get_grouped_reward(version)
+
+
+with tab1:
+    with st.expander("Гүйлгээний ангиллын аргачлал", expanded=True):
+        st.markdown(
+            """
+            ### Гүйлгээний ангиллын тайлбар
+
+            Энэхүү хуудсанд харуулах гүйлгээнүүдийн ангилалыг датасетын **`LOYAL_CODE`** дээр үндэслэн бизнесийн утга агуулгаар нь бүлэглэн ангилав.
+            Ангиллын зорилго нь хэрэглэгчдийн оноо цуглуулах үйл ажиллагааг **товчоор, ойлгомжтой** байдлаар нэгтгэхэд оршино.
+
+            #### Ангиллын үндсэн зарчим
+
+            **1. Санхүүгийн гүйлгээ (Financial Transactions)**  
+            Мөнгө шилжүүлэлт, төлбөр, зээлийн эргэн төлөлт болон картын гүйлгээнүүд.  
+
+            **2. Данс нээлт (Account Opening)**  
+            Хадгаламж, үнэт цаас, тэтгэврийн болон бусад данс нээхтэй холбоотой урамшууллууд.  
+
+            **3. Хөрөнгө оруулалт ба үнэт цаас (Investments & Securities)**  
+            Хувьцаа, crypto, арилжаа, 1072 хувьцаа болон хөрөнгө оруулалтын гүйлгээнүүд.  
+
+            **4. Худалдаа, өдөр тутмын хэрэглээ (Merchant & Lifestyle)**  
+            Худалдааны түнш, сугалаа, бараа үйлчилгээтэй холбоотой гүйлгээнүүд.  
+
+            **5. Даатгал (Insurance)**  
+            Даатгалын бүтээгдэхүүн болон даатгалтай холбоотой урамшуулалууд.  
+
+            **6. Урамшуулалын аян, арга хэмжээ (Campaigns & Events)**  
+            Маркетингийн кампанит ажил, Investor Week, сургалт, эвентүүд.  
+
+            **7. Social оролцоо (Social & Engagement)**  
+            Сошиал идэвхжил, мэдээлэл унших, селфи, контент хуваалцах үйлдлүүд.  
+
+            **8. Бүс нутгийн аян (Geographic Campaigns)**  
+            Тодорхой аймаг, хотод чиглэсэн кампанит ажлууд.
+            """,
+    )
+        code_groups = query(['transactions'], by=['CODE_GROUP', 'LOYAL_CODE'], version=version)
+        st.dataframe(code_groups.groupby('CODE_GROUP', observed=True)['LOYAL_CODE'].unique().map(list), use_container_width=True)
+    
+with tab2:
+
+    transaction_summary.columns = ['LOYAL_CODE', 'MONTH_NAME', 'MONTH_NUM','GROUP','Transaction_Freq','Total_Users', 'Total_Amount', 'DESC']
+
+    significant_movers = [
+        '10K_TRANSACTION_CARD',
+        '10K_CHARGE_SAVINGS2',
+        '10K_GET_LOTTO',
+        '10K_CHARGE_LIFE_OLD',
+    ]
+
+    transaction_summary['MOVERS'] = transaction_summary['LOYAL_CODE'].isin(significant_movers)
+
+    fig = build_animation_fig(transaction_summary, version)
+    plotly_chart(fig, use_container_width=True)
 
         
     #st.dataframe(transaction_summary)
@@ -250,9 +202,10 @@ with tab2:
         
         with col2:
             st.subheader("Ерөнхий тойм")
+            loyal_code_count = len(query(['transactions'], by=['LOYAL_CODE'], version=version))
             
             st.markdown(f"""
-                - 2025 оны **1–12** дугаар саруудад нийт **{df['LOYAL_CODE'].nunique()}** төрлийн урамшуулал олгогдсон байна.
+                - 2025 оны **1–12** дугаар саруудад нийт **{loyal_code_count}** төрлийн урамшуулал олгогдсон байна.
                 - 4-р сард **54** төрлийн урамшуулал олгогдсон нь хамгийн олон төрлийн урамшуулал олгосон сар болсон байна.
                 - Графикийн баруун дээд хэсэгт дараах урамшууллууд тогтвортой байрлаж байна:
                     -   **1к эрхийн гүйлгээний**
@@ -265,47 +218,37 @@ with tab2:
 
         st.divider()
 
-        movers_df = movers_df.sort_values(['DESC', 'MONTH_NUM']) 
-
-
-        fig = px.scatter(
-            movers_df,
-            x='Total_Users', 
-            y='Total_Amount', 
-            size='Transaction_Freq',
-            color='DESC',
-            size_max=30, 
-            hover_name='LOYAL_CODE',
-            hover_data=['MONTH_NAME'],
-            
-        )
-        fig.update_traces(marker=dict(sizemode='area'))
-
-
-        # 3. Add arrows for each group (DESC)
-        for desc in movers_df['DESC'].unique():
-            df_sub = movers_df[movers_df['DESC'] == desc]
-            n = len(df_sub) - 1
-
-            for i in range(n):
-                alpha = 0.05 + (0.8 * (i / n))
-
-                fig.add_annotation(
-                    x=df_sub.iloc[i+1]['Total_Users'],  # Arrow head x
-                    y=df_sub.iloc[i+1]['Total_Amount'], # Arrow head y
-                    ax=df_sub.iloc[i]['Total_Users'],   # Arrow tail x
-                    ay=df_sub.iloc[i]['Total_Amount'],  # Arrow tail y
-                    xref="x", yref="y",
-                    axref="x", ayref="y",
-                    showarrow=True,
-                    arrowhead=1,
-                    arrowsize=1,
-                    arrowwidth=2,
-                    arrowcolor=f"rgba(34,139,34 {alpha})"
-                )
-
         st.subheader('Ажиглалтууд: Өндөр өсөлттэй урамшууллууд')
-        st.plotly_chart(fig,use_container_width=True)
+
+        # Any set of codes can be traced; the chart and its selector rerun
+        # on their own.
+        @st.fragment
+        def movers_chart(transaction_summary):
+            descs = transaction_summary.drop_duplicates('LOYAL_CODE').set_index('LOYAL_CODE')['DESC']
+            movers = st.multiselect(
+                'Урамшуулал сонгох',
+                options=sorted(descs.index),
+                default=[code for code in significant_movers if code in descs.index],
+                format_func=lambda code: f"{code} - {descs[code]}",
+                key='movers',
+            )
+            movers_df = transaction_summary[transaction_summary['LOYAL_CODE'].isin(movers)]
+
+            fig = trajectory_plot(
+                movers_df,
+                x='Total_Users',
+                y='Total_Amount',
+                size='Transaction_Freq',
+                group='LOYAL_CODE',
+                order='MONTH_NUM',
+                name='DESC',
+                hover_name='LOYAL_CODE',
+                hover_data=['MONTH_NAME'],
+                size_max=30,
+            )
+            plotly_chart(fig,use_container_width=True)
+
+        movers_chart(transaction_summary)
 
         col1,col2 = st.columns(2)
         with col1:
@@ -326,10 +269,11 @@ with tab2:
         
         st.divider()
 
+        financial = query(['customers', 'points'], where={'CODE_GROUP': 'Financial Transactions'}, version=version)
         st.markdown(f"""
             ##### Гүйлгээний Урамшуулал:  
             - 2025 оны бүх сард хамгийн өндөр урамшууллын оноо тараагдсан мөн хамгийн олон оролцогчид оролцсон төрөл.
-            - 2025 онд нийт **{df[df['CODE_GROUP'] == 'Financial Transactions']['CUST_CODE'].nunique():,}** хэрэглэгчид урамшуулал авж **{df[df['CODE_GROUP'] == 'Financial Transactions']['TXN_AMOUNT'].sum():,.0f}** оноо тараагдсан.
+            - 2025 онд нийт **{financial['customers'].sum():,}** хэрэглэгчид урамшуулал авж **{financial['points'].sum():,.0f}** оноо тараагдсан.
         """)
 
 
@@ -376,7 +320,7 @@ with tab3:
               opacity=0.3
     )
     
-    st.plotly_chart(line_chart_fig, use_container_width=True)
+    plotly_chart(line_chart_fig, use_container_width=True)
     st.subheader('2025 ОНЫ ХЭРЭГЛЭГЧДИЙН ГҮЙЛГЭЭНИЙ ТӨРЛИЙН ШИНЖИЛГЭЭ')
 
     with st.expander(expanded=True, label= 'Тайлбар:'):
@@ -394,33 +338,39 @@ with tab3:
                 -   Үүнээс хойш тогтмол унасаар **Данс Нээсний** урамшуулалтай адил 7-р сар хүрээд дахиж оноо тараагдаагүй байна     
         """)
         
-    with st.expander('Сар тус бүрээр харах:', expanded=False):
-        available_months = grouped_reward['MONTH_NAME'].unique()
-        final_options = [m for m in month_order if m in available_months]
-        selected_month = st.selectbox(
-            'Choose a month to analyze',
-            options=final_options,
-        )
-        monthly_grouped_reward = grouped_reward[grouped_reward['MONTH_NAME'] == selected_month]
-
-        fig = donut_plot(
-            monthly_grouped_reward, 
-            'CODE_GROUP', 
-            'TOTAL_AMOUNT',
-            f'Percentage of Total Points by Transaction Group in {selected_month}'
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
+    # The month's donut and its table rerun on their own when the month
+    # changes, from the cached grouped_reward.
+    @st.fragment
+    def month_reward(grouped_reward):
+        with st.expander('Сар тус бүрээр харах:', expanded=False):
+            available_months = grouped_reward['MONTH_NAME'].unique()
+            final_options = [m for m in month_order if m in available_months]
+            selected_month = st.selectbox(
+                'Choose a month to analyze',
+                options=final_options,
+            )
+            monthly_grouped_reward = grouped_reward[grouped_reward['MONTH_NAME'] == selected_month]
+
+            fig = donut_plot(
+                monthly_grouped_reward, 
+                'CODE_GROUP', 
+                'TOTAL_AMOUNT',
+                f'Percentage of Total Points by Transaction Group in {selected_month}'
+            )
+
+            plotly_chart(fig, use_container_width=True)
 
 
     
-    with st.expander("Хүснэгт харах:", expanded=False):
-        st.dataframe(monthly_grouped_reward, use_container_width=True)
+        with st.expander("Хүснэгт харах:", expanded=False):
+            st.dataframe(monthly_grouped_reward, use_container_width=True)
+
+    month_reward(grouped_reward)
 
 
 with tab4:
 
-    transaction_summary_year = transaction_summary.groupby('LOYAL_CODE')['Total_Amount'].sum().reset_index()
+    transaction_summary_year = transaction_summary.groupby('LOYAL_CODE', observed=True)['Total_Amount'].sum().reset_index()
     top5_transaction = transaction_summary_year.nlargest(5,columns='Total_Amount')
 
     other_total = transaction_summary_year['Total_Amount'].sum() - top5_transaction['Total_Amount'].sum()
@@ -428,7 +378,7 @@ with tab4:
     other_row = pd.DataFrame({'LOYAL_CODE': ['Бусад'], 'Total_Amount': [other_total]})
 
     transaction_summary_year_top5 = pd.concat([top5_transaction, other_row], ignore_index=True)        
-    transaction_summary_year_top5['DESC'] = transaction_summary_year_top5['LOYAL_CODE'].map(loyal_code_to_desc)
+    transaction_summary_year_top5['DESC'] = describe_codes(transaction_summary_year_top5['LOYAL_CODE'], version=version)
     transaction_summary_year_top5['DESC'] = transaction_summary_year_top5['DESC'].fillna('Бусад')
     fig = donut_plot(
         transaction_summary_year_top5,
@@ -448,17 +398,15 @@ with tab4:
         )
     ) 
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
 
-    transaction_bar_plot_df = df.groupby('LOYAL_CODE').agg({
-        'TXN_AMOUNT': 'sum',
-        'JRNO': 'count'
-    })
+    transaction_bar_plot_df = query(['points', 'transactions'], by=['LOYAL_CODE'], version=version).set_index('LOYAL_CODE')
+    transaction_bar_plot_df.columns = ['TXN_AMOUNT', 'JRNO']
     transaction_bar_plot_df['AVG'] = (transaction_bar_plot_df['TXN_AMOUNT'] / transaction_bar_plot_df['JRNO']).round(2)
     transaction_bar_plot_df['PERCENTAGE'] =(( transaction_bar_plot_df['TXN_AMOUNT']/transaction_bar_plot_df['TXN_AMOUNT'].sum() )* 100).round(2)
     transaction_bar_plot_df = transaction_bar_plot_df[transaction_bar_plot_df['PERCENTAGE']>2].reset_index()
     transaction_bar_plot_df = transaction_bar_plot_df.sort_values(by='AVG')
-    transaction_bar_plot_df['DESC'] = transaction_bar_plot_df['LOYAL_CODE'].map(loyal_code_to_desc)
+    transaction_bar_plot_df['DESC'] = describe_codes(transaction_bar_plot_df['LOYAL_CODE'], version=version)
 
 
     fig = px.bar(
@@ -483,6 +431,7 @@ with tab4:
     )
     fig.update_traces(textposition='outside')
 
+    card_10k = query(['customers', 'points'], where={'LOYAL_CODE': '10K_TRANSACTION'}, version=version)
     with st.expander(expanded=False, label='Тайлбар:'):
         st.markdown(f"""
             #### Гүйлгээний шинжилгээ
@@ -491,13 +440,13 @@ with tab4:
                     
             #### 1к эрхийн гүйлгээний урамшуулал:  
             - 2025 оны бүх сард хамгийн өндөр урамшууллын оноо тараагдсан мөн хамгийн олон оролцогчид оролцсон төрөл.
-            - 2025 онд нийт **{df[df['LOYAL_CODE'] == '10K_TRANSACTION']['CUST_CODE'].nunique():,}** хэрэглэгчдэд **{df[df['LOYAL_CODE'] == '10K_TRANSACTION']['TXN_AMOUNT'].sum():,.0f}** оноо тараагдсан.
+            - 2025 онд нийт **{card_10k['customers'].sum():,}** хэрэглэгчдэд **{card_10k['points'].sum():,.0f}** оноо тараагдсан.
         """)
     
     st.divider()
 
     st.subheader("Нэгж гүйлгээний дундаж урамшууллын онооны шинжилгээ")
-    st.plotly_chart(fig)
+    plotly_chart(fig)
     st.caption('Нийт оноонд 1% аас илүү хувь нэмэр оруулсан гүйлгээнүүдийг жагсаав.')
      
     with st.expander(expanded=False, label='Тайлбар:'):
@@ -1,62 +1,21 @@
 import streamlit as st
-from data_loader import load_data, get_lookup
-from page1 import bar_plot_h
+from data_loader import dataset_version
+from metrics import get_customer_month_facts
+from cube import query
+from charts import donut_plot, plotly_chart
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 from plotly.subplots import make_subplots
 
 
-@st.cache_data(show_spinner=False)
-def load_base():
-    return load_data()
-
-df = load_base()
+version = dataset_version()
+facts = get_customer_month_facts(version)
 
 st.header('ОНЦЛОХ САРЫН ШИНЖИЛГЭЭ', anchor='center')
 
-def donut_plot(df, labels_col, values_col, title_text=""):
-    fig = go.Figure(data=[go.Pie(
-        labels=df[labels_col], 
-        values=df[values_col], 
-        hole=.6,              
-        marker=dict(line=dict(color='#FFFFFF', width=2)), # White borders between slices
-        hoverinfo='label+percent+value',
-        textinfo='percent',    
-        textfont_size=16,
-    )])
-
-    fig.update_layout(
-        title=dict(
-            text=f"<b>{title_text}</b>",
-            #x=0.5,            
-            font=dict(size=24)
-        ),
-        height=500,            
-        width=800,             
-        
-        # CLEANING UP
-        template='plotly_white',
-        showlegend=True,
-        legend=dict(
-            orientation="h",   
-            yanchor="bottom",
-            y=-0.2,            
-            xanchor="center",
-            x=0.5,
-            font=dict(size=14)
-        ),
-        #"Donut Hole" text
-        annotations=[dict(text='Total', x=0.5, y=0.5, font_size=20, showarrow=False)]
-    )
-    
-    return fig
-
-monthly_totals = (
-    df
-    .groupby('MONTH_NUM', as_index=False)['TXN_AMOUNT']
-    .sum()
-)
+monthly_totals = query(['points'], by=['MONTH_NUM'], version=version).rename(columns={'points': 'TXN_AMOUNT'})
+loyal_code_months = query(['points'], by=['MONTH_NUM', 'LOYAL_CODE'], version=version)
 
 barplot_month_df = pd.DataFrame({
     'Metric': ['April', 'May', 'Monthly Average'],
@@ -68,7 +27,7 @@ barplot_month_df = pd.DataFrame({
 })
 
 monthly_total_code = (
-    df
+    loyal_code_months
     .groupby('MONTH_NUM', as_index=False)['LOYAL_CODE']
     .nunique()
 )
@@ -176,7 +135,7 @@ with tab1:
     col1,col2 = st.columns([0.6,0.4],gap='large')
 
     with col1:
-        st.plotly_chart(fig,use_container_width=True)
+        plotly_chart(fig,use_container_width=True)
 
     with col2:
         st.subheader('Дундаж оноо')
@@ -194,9 +153,9 @@ with tab1:
 
         target_months = [4, 5]
 
-        loyal_code_months = df.groupby('LOYAL_CODE')['MONTH_NUM'].unique()
+        code_months = loyal_code_months.groupby('LOYAL_CODE', observed=True)['MONTH_NUM'].unique()
 
-        loyal_codes_45_only = loyal_code_months[loyal_code_months.apply(lambda months: all(m in target_months for m in months))]
+        loyal_codes_45_only = code_months[code_months.apply(lambda months: all(m in target_months for m in months))]
 
         loyal_codes_45_only_list = loyal_codes_45_only.index.tolist()
         #loyal_codes_45_only_list = loyal_codes_only_in_months(df, [4, 5])
@@ -209,8 +168,8 @@ with tab1:
         Бүх **28** урамшуулал **Investor Week-тэй** холбоотой бөгөөд нийт **963,922** оноог тараасан нь 4,5-р сарын өсөлт **Investor Week-тэй** шууд хамааралтайг харуулж байна.
     """)
     st.divider()
-    filtered_month4 = df[df['MONTH_NUM'] == 4]
-    filtered_month4_loyal = filtered_month4.groupby('LOYAL_CODE')['TXN_AMOUNT'].sum().sort_values(ascending=False).reset_index()
+    filtered_month4 = query(['points'], by=['LOYAL_CODE'], where={'MONTH_NUM': 4}, version=version)
+    filtered_month4_loyal = filtered_month4.set_index('LOYAL_CODE')['points'].rename('TXN_AMOUNT').sort_values(ascending=False).reset_index()
     investor_week_amount = filtered_month4_loyal[filtered_month4_loyal['LOYAL_CODE'].str.lower().str.contains('investor')]
 
     investor_week_donut_df = investor_week_amount.nlargest(n=9, columns='TXN_AMOUNT').copy()
@@ -234,7 +193,7 @@ with tab1:
             x = 0.5
         )
     )
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
 
     st.markdown(f"""
         - Investor Week: **2025-04-28-аас 2025-05-02** ын хооронд болсон.
@@ -250,8 +209,8 @@ with tab2:
     with st.expander(label='Шинэ Хэрэглэгчийн Шинжилгээ:', expanded=True):
         col1,col2 = st.columns([0.6,0.4])
         with col1:
-            user_first_month = df.groupby('CUST_CODE')['MONTH_NUM'].min().reset_index()
-            cust_point_monthly = df.groupby(['CUST_CODE', 'MONTH_NUM'])['TXN_AMOUNT'].sum().reset_index()
+            user_first_month = facts.groupby('CUST_CODE', observed=True)['MONTH_NUM'].min().reset_index()
+            cust_point_monthly = facts[['CUST_CODE', 'MONTH_NUM', 'Total_Points']].rename(columns={'Total_Points': 'TXN_AMOUNT'})
             new_user_df = pd.merge(left=user_first_month, right=cust_point_monthly, on=['CUST_CODE','MONTH_NUM'],how='left')
             new_user_df = new_user_df.groupby('MONTH_NUM').agg({
                 'CUST_CODE': 'nunique',
@@ -333,7 +292,7 @@ with tab2:
                 xanchor="right",
                 x=1
             ))
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart(fig, use_container_width=True)
 
         with col2:
             st.subheader('Графикийн тайлбар:')
@@ -347,13 +306,14 @@ with tab2:
     st.divider()        
 
     with st.expander(label = 'Урамшууллын бүлэг:', expanded=True):
-        code_group_acc_insur_df = df[df['CODE_GROUP'].isin(['Insurance','Investments & Securities','Account Opening'])].groupby(['MONTH_NUM', 'CODE_GROUP']).agg({
-            'JRNO': 'count',
-            'TXN_AMOUNT': 'sum',
-            'CUST_CODE': 'nunique'
-        }).reset_index()
+        code_group_acc_insur_df = query(
+            ['transactions', 'points', 'customers'],
+            by=['MONTH_NUM', 'CODE_GROUP'],
+            where={'CODE_GROUP': ['Insurance','Investments & Securities','Account Opening']},
+            version=version,
+        ).drop(columns='MONTH_NAME').rename(columns={'transactions': 'JRNO', 'points': 'TXN_AMOUNT', 'customers': 'CUST_CODE'})
 
-        monthly_total_points_df = df.groupby('MONTH_NUM')['TXN_AMOUNT'].sum().reset_index(name='TOTAL_POINTS')
+        monthly_total_points_df = monthly_totals[['MONTH_NUM', 'TXN_AMOUNT']].rename(columns={'TXN_AMOUNT': 'TOTAL_POINTS'})
 
         code_group_acc_insur_df = pd.merge(left=code_group_acc_insur_df,right = monthly_total_points_df, on='MONTH_NUM')
         code_group_acc_insur_df['PERCENTAGE'] =( code_group_acc_insur_df['TXN_AMOUNT'] / code_group_acc_insur_df['TOTAL_POINTS'] * 100 ).round(2)
@@ -407,7 +367,7 @@ with tab2:
                     text = 'Шинэ Хэрэглэгчдийн Тоо болон Оноо'
                 )
             )
-        st.plotly_chart(fig,use_container_width=True)
+        plotly_chart(fig,use_container_width=True)
 
         st.subheader('Урамшуулалтай холбоотой уналт:')
         st.info("""
@@ -0,0 +1,149 @@
+import fnmatch
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_loader import DATA_PATH, DATASET_DIR, DIMENSION_COLUMNS, MONTH_ORDER, write_partitioned, write_partitions
+
+# Ordered LOYAL_CODE glob -> CODE_GROUP table; the first matching pattern
+# wins. export_code_group_rules() seeds it from the current dataset.
+CODE_GROUP_RULES_PATH = "code_group_rules.csv"
+
+# Columns of the system log export (see home.py). Codes are read as strings
+# even when a block happens to look numeric.
+RAW_COLUMN_TYPES = {
+    "TXN_DATE": pa.timestamp("us"),
+    "TXN_DESC": pa.string(),
+    "JRNO": pa.int64(),
+    "TXN_AMOUNT": pa.float64(),
+    "CUST_CODE": pa.string(),
+    "USER_ID": pa.int64(),
+    "NAME": pa.string(),
+    "LOYAL_CODE": pa.string(),
+    "OPER_CODE": pa.string(),
+}
+SORT_KEYS = [("TXN_DATE", "ascending"), ("CUST_CODE", "ascending")]
+BLOCK_SIZE = 64 << 20
+ROW_GROUP_SIZE = 256_000
+
+logger = logging.getLogger(__name__)
+
+
+def load_code_group_rules(path=CODE_GROUP_RULES_PATH):
+    rules = pd.read_csv(path, keep_default_na=False, dtype=str)
+    return list(zip(rules["PATTERN"], rules["CODE_GROUP"]))
+
+
+def export_code_group_rules(path=CODE_GROUP_RULES_PATH):
+    # One exact-code rule per LOYAL_CODE already classified in the dataset;
+    # glob rules (e.g. INVESTORWEEK*) can be added above them by hand.
+    from data_loader import dataset_version, get_loyal_code_dim
+
+    dim = get_loyal_code_dim(dataset_version())
+    rules = dim["CODE_GROUP"].dropna().rename_axis("PATTERN").reset_index()
+    rules.to_csv(path, index=False)
+    logger.info("wrote %s rules to %s", len(rules), path)
+
+
+def clean_desc(desc):
+    # Lower-case, punctuation to spaces, trimmed: the form TXN_DESC has in
+    # the published dataset.
+    desc = pc.utf8_lower(desc)
+    desc = pc.replace_substring_regex(desc, pattern=r"[^\p{L}\p{N}\s]", replacement=" ")
+    return pc.utf8_trim_whitespace(desc)
+
+
+def classify_codes(codes, rules):
+    # Rules are matched once per distinct code in the block, then expanded
+    # through the dictionary indices.
+    encoded = pc.dictionary_encode(codes).combine_chunks()
+    groups = [
+        next((group for pattern, group in rules if fnmatch.fnmatchcase(code, pattern)), None)
+        for code in encoded.dictionary.to_pylist()
+    ]
+    unmatched = [code for code, group in zip(encoded.dictionary.to_pylist(), groups) if group is None]
+    if unmatched:
+        logger.warning("no CODE_GROUP rule for %s", ", ".join(unmatched))
+    return pc.take(pa.array(groups, pa.string()), encoded.indices)
+
+
+def transform(table, rules):
+    loyal_code = pc.fill_null(table["LOYAL_CODE"], "None")
+    loyal_code = pc.if_else(pc.equal(loyal_code, ""), "None", loyal_code)
+    month = pc.month(table["TXN_DATE"])
+
+    table = table.set_column(table.schema.get_field_index("TXN_DESC"), "TXN_DESC", clean_desc(table["TXN_DESC"]))
+    table = table.set_column(table.schema.get_field_index("LOYAL_CODE"), "LOYAL_CODE", loyal_code)
+    table = table.append_column("CODE_GROUP", classify_codes(loyal_code, rules))
+    table = table.append_column("MONTH_NUM", pc.cast(month, pa.int32()))
+    table = table.append_column("MONTH_NAME", pc.take(pa.array(MONTH_ORDER), pc.subtract(month, 1)))
+    return table
+
+
+def _finish_partition(spill_dir, dest_dir):
+    # A month is the unit that has to fit in memory: its blocks are sorted
+    # together and written with dictionary-encoded string columns.
+    table = ds.dataset(spill_dir, format="parquet").to_table().sort_by(SORT_KEYS)
+    for name in DIMENSION_COLUMNS:
+        if name in table.column_names:
+            table = table.set_column(table.schema.get_field_index(name), name, pc.dictionary_encode(table[name]))
+
+    if os.path.isdir(dest_dir):
+        shutil.rmtree(dest_dir)
+    os.makedirs(dest_dir)
+    pq.write_table(table, os.path.join(dest_dir, "part-0.parquet"), row_group_size=ROW_GROUP_SIZE, compression="zstd")
+    return table.num_rows
+
+
+def ingest_raw(source, dest=DATASET_DIR, rules_path=CODE_GROUP_RULES_PATH, block_size=BLOCK_SIZE):
+    # Streams the export block by block into per-month spill files next to
+    # dest, then sorts and rewrites one month at a time. Months present in
+    # the export replace the same months in dest; other months are kept.
+    # The single-file dataset is converted first, or dest would hold only
+    # the export's months once it exists.
+    if not os.path.isdir(dest) and os.path.exists(DATA_PATH):
+        write_partitioned(DATA_PATH, dest)
+
+    rules = load_code_group_rules(rules_path)
+    reader = pacsv.open_csv(
+        source,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(column_types=RAW_COLUMN_TYPES, strings_can_be_null=True),
+    )
+
+    spill = tempfile.mkdtemp(prefix=".spill-", dir=os.path.dirname(os.path.abspath(dest)))
+    try:
+        rows = 0
+        for i, batch in enumerate(reader):
+            table = transform(pa.Table.from_batches([batch]), rules)
+            write_partitions(table, spill, basename_template=f"block-{i}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore")
+            rows += table.num_rows
+        logger.info("read %s rows from %s", rows, source)
+
+        for root, _, files in os.walk(spill):
+            if files:
+                partition = os.path.relpath(root, spill)
+                written = _finish_partition(root, os.path.join(dest, partition))
+                logger.info("wrote %s rows to %s", written, partition)
+    finally:
+        shutil.rmtree(spill)
+
+
+if __name__ == "__main__":
+    # python raw_ingest.py export.csv [export.csv ...]
+    # python raw_ingest.py --export-rules
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if sys.argv[1:] == ["--export-rules"]:
+        export_code_group_rules()
+    else:
+        for path in sys.argv[1:]:
+            ingest_raw(path)
@@ -0,0 +1,82 @@
+import operator
+
+import numpy as np
+import pandas as pd
+
+from data_loader import shared_resource
+from metrics import get_customer_month_facts
+
+_OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+}
+
+# Ordered rule table: a customer-month gets the first segment whose conditions
+# all hold, DEFAULT_SEGMENT if none do. A condition compares a fact column
+# with a number or with a threshold name from get_thresholds().
+SEGMENT_RULES = (
+    ('Inactive', (('Inactive', '==', 1),)),
+    ('Achiever', (('Reached_1000_Flag', '==', 1),)),
+    ('High_Effort', (('Transaction_Count', '>=', 'achievers_txn_q25'),)),
+    ('Explorer', (('Transaction_Count', '<', 'txn_q75'), ('Active_Days', '<=', 'days_q75'))),
+    ('Consistent', (('Transaction_Count', '>=', 'txn_q75'), ('Active_Days', '>', 'days_q75'))),
+)
+DEFAULT_SEGMENT = 'Irregular_Participant'
+
+SEGMENT_LABELS_MN = {
+    'Inactive': 'Идэвхгүй',
+    'Achiever': 'Амжилттай',
+    'High_Effort': 'Их_чармайлттай',
+    'Explorer': 'Туршигч',
+    'Consistent': 'Тогтвортой',
+    'Irregular_Participant': 'Тогтмол_бус_оролцогч',
+}
+
+
+@shared_resource
+def get_thresholds(version):
+    facts = get_customer_month_facts(version)
+    under_1000 = facts[(facts['Reached_1000_Flag'] == 0) & (facts['Inactive'] == 0)]
+    reached_1000 = facts[facts['Reached_1000_Flag'] == 1]
+
+    return {
+        'txn_q25': under_1000['Transaction_Count'].quantile(0.25),
+        'txn_q75': under_1000['Transaction_Count'].quantile(0.75),
+        'days_q25': under_1000['Active_Days'].quantile(0.25),
+        'days_q75': under_1000['Active_Days'].quantile(0.75),
+        'points_q25': under_1000['Total_Points'].quantile(0.25),
+        'points_q75': under_1000['Total_Points'].quantile(0.75),
+        'achievers_txn_q25': reached_1000['Transaction_Count'].quantile(0.25),
+    }
+
+
+def evaluate_rules(frame, rules, thresholds, default):
+    conditions = []
+    for _, clauses in rules:
+        mask = np.ones(len(frame), dtype=bool)
+        for column, op, value in clauses:
+            if isinstance(value, str):
+                value = thresholds[value]
+            mask &= _OPS[op](frame[column].to_numpy(), value)
+        conditions.append(mask)
+
+    names = [name for name, _ in rules] + [default]
+    codes = np.select(conditions, np.arange(len(rules)), default=len(rules))
+    return pd.Categorical.from_codes(codes, categories=names)
+
+
+@shared_resource
+def get_segments(version, rules=SEGMENT_RULES, default=DEFAULT_SEGMENT, labels=None, thresholds=None):
+    # thresholds only needs the names being overridden; the rest come from
+    # the dataset's quantiles.
+    facts = get_customer_month_facts(version)
+    thresholds = {**get_thresholds(version), **(thresholds or {})}
+
+    segments = evaluate_rules(facts, rules, thresholds, default)
+    if labels:
+        segments = segments.rename_categories(lambda name: labels.get(name, name))
+
+    return pd.Series(segments, index=facts.index, name='User_Segment')
@@ -0,0 +1,88 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_loader import (
+    DERIVED_COLUMNS, PARTITION_COLUMNS, SOURCE_COLUMNS,
+    check_schema, normalize, read_data, read_lookup, schema_problems, shared_resource, source_dataset,
+)
+
+# Placeholder strings the export writes instead of a missing value. LOYAL_CODE
+# 'None' is how the log marks a transaction without a code.
+SENTINELS = ["None", "NULL", "null", "NaN", "nan", "N/A", ""]
+
+logger = logging.getLogger(__name__)
+
+
+def _sentinel_counts(s):
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(s.cat.categories))
+        return int(counts[s.cat.categories.isin(SENTINELS)].sum())
+    if pd.api.types.is_string_dtype(s.dtype):
+        return int(s.isin(SENTINELS).sum())
+    return 0
+
+
+def validate(df, schema):
+    # One vectorized pass per check over a normalized frame. Nothing here
+    # drops or fixes rows; the report says what the pages would otherwise
+    # have to filter around.
+    amounts = df["TXN_AMOUNT"]
+    if pd.api.types.is_float_dtype(amounts.dtype):
+        fractional = int((amounts.notna() & (amounts != np.floor(amounts))).sum())
+    else:
+        fractional = 0
+
+    codes = df["LOYAL_CODE"].value_counts()
+    codes = codes[codes > 0]
+    missing_codes = codes[~codes.index.isin(read_lookup().index)]
+
+    return {
+        "rows": len(df),
+        "schema_problems": schema_problems(schema),
+        "unexpected_columns": [
+            name for name in schema.names
+            if name not in SOURCE_COLUMNS + DERIVED_COLUMNS + PARTITION_COLUMNS
+        ],
+        "nulls": df[SOURCE_COLUMNS].isna().sum(),
+        "sentinels": pd.Series({name: _sentinel_counts(df[name]) for name in SOURCE_COLUMNS}),
+        "fractional_amounts": fractional,
+        "duplicate_jrno": int(df["JRNO"].duplicated().sum()),
+        "missing_codes": missing_codes,
+    }
+
+
+def log_report(report, source):
+    issues = {
+        "nulls": int(report["nulls"].sum()),
+        "sentinel values": int(report["sentinels"].sum()),
+        "fractional TXN_AMOUNT": report["fractional_amounts"],
+        "duplicate JRNO": report["duplicate_jrno"],
+        "rows with codes missing from the lookup": int(report["missing_codes"].sum()),
+    }
+    for name, count in issues.items():
+        if count:
+            logger.warning("%s: %s %s", source, count, name)
+
+
+@shared_resource
+def get_validation_report(version):
+    # Runs once per dataset version; the schema itself is enforced on every
+    # read from the source, so a report only exists for a loadable dataset.
+    df = read_data(columns=SOURCE_COLUMNS)
+    report = validate(df, source_dataset().schema)
+    log_report(report, "dataset")
+    return report
+
+
+def validate_batch(batch):
+    # Ingest-time check for a batch of raw transactions: a schema mismatch
+    # rejects the batch, everything else is logged and returned.
+    schema = pa.Schema.from_pandas(batch, preserve_index=False)
+    check_schema(schema)
+    report = validate(normalize(batch[SOURCE_COLUMNS].copy()), schema)
+    log_report(report, "batch")
+    return report
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+
+import streamlit as st
+
+from cube import get_cube
+from data_loader import dataset_version, get_loyal_code_dim, get_profile
+from metrics import POINTS_BINS, get_achiever_box_stats, get_fact_state, get_points_histogram
+from segments import SEGMENT_LABELS_MN, get_segments, get_thresholds
+from validation import get_validation_report
+
+# Shared aggregates in dependency order: each step only reads caches the
+# steps before it have filled. The calls match the pages' own calls
+# argument for argument (page4 passes an empty override dict), so they land
+# on the same cache keys.
+WARMUP_STEPS = (
+    ('profile', get_profile),
+    ('validation', get_validation_report),
+    ('facts', get_fact_state),
+    ('histogram', lambda version: get_points_histogram(version, **POINTS_BINS)),
+    ('box_stats', get_achiever_box_stats),
+    ('thresholds', get_thresholds),
+    ('segments', lambda version: get_segments(version, thresholds={})),
+    ('segments_mn', lambda version: get_segments(version, labels=SEGMENT_LABELS_MN)),
+    ('cube', get_cube),
+    ('lookup', get_loyal_code_dim),
+)
+
+# Steps a page reads on its first run; the page counts as warm once all of
+# them are done.
+PAGE_STEPS = {
+    'home.py': ('profile', 'validation'),
+    'page1.py': ('facts', 'histogram'),
+    'page2.py': ('cube', 'lookup'),
+    'page3.py': ('cube',),
+    'page4.py': ('box_stats', 'thresholds', 'segments', 'cube', 'lookup'),
+    'page5.py': ('segments_mn', 'lookup'),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(version, status):
+    for name, step in WARMUP_STEPS:
+        if dataset_version() != version:
+            # A newer version has its own warm-up; this one would only
+            # compute caches that are already retired.
+            logger.info("dataset changed, warm-up for the old version stopped")
+            break
+        started = time.perf_counter()
+        try:
+            step(version)
+        except Exception:
+            # A failed step is left for the page to compute (and report)
+            # on its own, so its pages stay marked; the rest still warm.
+            logger.exception("warm-up step %s failed", name)
+            status['failed'].append(name)
+        else:
+            logger.info("warmed %s in %.1fs", name, time.perf_counter() - started)
+            status['done'].append(name)
+    status['running'] = False
+
+
+# One warm-up thread per dataset version for the whole server process; every
+# session gets the same status dict and only reads it. Only the current
+# version's status is kept.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def start_warmup(version):
+    status = {'done': [], 'failed': [], 'total': len(WARMUP_STEPS), 'running': True}
+    threading.Thread(target=warm_up, args=(version, status), name='warmup', daemon=True).start()
+    return status
+
+
+def page_ready(status, page):
+    return all(name in status['done'] for name in PAGE_STEPS.get(page, ()))
+
+
+if __name__ == "__main__":
+    # python warmup.py: fill the persisted artifacts (fact state, cube)
+    # before the server starts.
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    version = dataset_version()
+    warm_up(version, {'done': [], 'failed': [], 'total': len(WARMUP_STEPS), 'running': True})